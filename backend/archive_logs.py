@@ -0,0 +1,18 @@
+import argparse
+
+from main import LOG_ARCHIVE_DIR, LOG_RETENTION_DAYS, archive_logs
+
+# 保持期間を過ぎた監査ログを gzip (NDJSON) に書き出して logs テーブルから消す (サーバー起動中は 1 日 1 回自動で実行)
+#   python archive_logs.py --dry-run      # 対象件数だけ表示
+#   python archive_logs.py --days 90      # 90 日より古いものを移す
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="古い監査ログをアーカイブファイルへ移す")
+    parser.add_argument("--dry-run", action="store_true", help="移さずに件数だけ表示する")
+    parser.add_argument("--days", type=float, default=LOG_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    moved = archive_logs(older_than_days=args.days, batch_size=args.batch_size, dry_run=args.dry_run)
+    label = "移動予定" if args.dry_run else f"移動 ({LOG_ARCHIVE_DIR})"
+    print(f"{label}: {moved} 件")
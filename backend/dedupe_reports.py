@@ -0,0 +1,19 @@
+import argparse
+
+from main import DUPLICATE_ACTION, SessionLocal, dedupe_reports
+
+# 既存レポートの重複 (同カテゴリ・近距離・短期間) を古いレポートに紐付ける
+#   python dedupe_reports.py --dry-run        # 紐付け予定の件数だけ表示
+#   python dedupe_reports.py --action link    # status を duplicate にして紐付ける
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重複レポートを元のレポートに紐付ける")
+    parser.add_argument("--dry-run", action="store_true", help="更新せずに件数だけ表示する")
+    parser.add_argument("--action", choices=("link", "flag"), default=DUPLICATE_ACTION if DUPLICATE_ACTION != "off" else "flag")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        marked = dedupe_reports(db, batch_size=args.batch_size, dry_run=args.dry_run, action=args.action)
+    label = "紐付け予定" if args.dry_run else "紐付け"
+    print(f"{label}: {marked} 件")
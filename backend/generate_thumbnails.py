@@ -0,0 +1,40 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from main import Image, SessionLocal
+from utils.thumbnails import make_derivatives
+
+# サムネイル導入前にアップロードされた画像の派生画像をまとめて作る
+#   python generate_thumbnails.py --dry-run   # 対象件数だけ表示
+#   python generate_thumbnails.py --workers 4
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="サムネイル未作成の画像に派生画像を作る")
+    parser.add_argument("--dry-run", action="store_true", help="生成せずに件数だけ表示する")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        rows = db.query(Image).filter(Image.thumb_path.is_(None)).order_by(Image.id).all()
+        if args.dry_run:
+            print(f"対象: {len(rows)} 件")
+            raise SystemExit
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for start in range(0, len(rows), args.batch_size):
+                batch = rows[start:start + args.batch_size]
+                futures = [(image, pool.submit(make_derivatives, image.image_path)) for image in batch]
+                for image, future in futures:
+                    try:
+                        paths = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"image {image.id}: {e}")
+                        continue
+                    # ORM 経由で更新し、レポートの version (ETag) も進める
+                    image.thumb_path = paths["thumb"]
+                    image.preview_path = paths["preview"]
+                    done += 1
+                db.commit()
+    print(f"生成: {done} 件 / 失敗: {failed} 件")
@@ -1,15 +1,26 @@
 import datetime
 from datetime import timezone
+from zoneinfo import ZoneInfo
 import os
+import base64
+import hashlib
+import glob
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import zipfile
+from email.utils import format_datetime, parsedate_to_datetime
+from collections import Counter, defaultdict
 import io
 import csv
 import json
+import gzip
 from fastapi import FastAPI
 from models import User, Organization, OrgLink
 import logging
 from fastapi import FastAPI, APIRouter
 import requests
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pathlib import Path
 from pydantic import BaseModel
 from schemas import ChatMessageCreate
@@ -37,22 +48,28 @@ from deps import get_current_user
 from fastapi import (
     FastAPI, File, UploadFile, Form, HTTPException, Depends,
     status, Query, Request, WebSocket, WebSocketDisconnect,
-    APIRouter, Body
+    APIRouter, Body, Header
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from starlette.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.websockets import WebSocketState
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.exceptions import RequestValidationError
 from typing import List
 from sqlalchemy import (
     create_engine, Column, Integer, String, Float, DateTime, ForeignKey,
-    Boolean, Text, func, or_, Table, JSON
+    Boolean, Text, func, or_, and_, exists, Table, JSON, Index, event, inspect, text, insert, case, select
 )
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
+from sqlalchemy.orm import (
+    declarative_base, sessionmaker, relationship, Session, object_session, selectinload
+)
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.exc import IntegrityError
 
+import numpy as np
 import uvicorn
 
 app = FastAPI(title="WalkAudit-GO API")
@@ -66,28 +83,86 @@ from database import get_db
 from models import User, ChatMessage, Report, Organization, Area
 from schemas import ChatMessageOut, ChatMessageCreate  # schemas.py に定義されているもの
 from deps import get_current_active_user, get_current_city_user, verify_token
+from utils.grid_index import cell_of, cell_ranges
+from utils.geo import distance_m, radius_bbox
+from utils.file_range import RangeNotSatisfiable, iter_file_range, parse_byte_range
+from utils.gis_export import geoparquet_available, iter_flatgeobuf, iter_geoparquet
+from utils.cluster_index import CLUSTER_MAX_ZOOM, ClusterIndex, ClusterStore
+from utils.heatmap import HEATMAP_CELL_SIZES, GridTooLarge, HeatmapStore, grid_features
+from utils.mvt import TILE_MAX_ZOOM, encode_point_layer, tile_bounds
+from utils.tile_cache import TileCache
+from utils.area_utils import find_city_org_id, get_area_matcher, invalidate_area_matcher, load_area_rows
+from utils.ttl_cache import TTLCache
+from utils.report_search import FTS_TABLE, SEARCH_COLUMNS, fts_match_expression, setup_report_search
+from utils.area_polygons import get_area_index, invalidate_area_index, parse_polygons
+from utils.uploads import UploadBudget, UploadClaims, UploadMetrics, UploadTooLarge, store_upload
+from utils.thumbnails import DERIVATIVE_SIZES, ThumbnailWorker, derivative_paths
+from utils.log_setup import SamplingFilter, parse_levels, setup_logging
+from utils.upsert import upsert_increment
+from utils.report_import import (
+    ArchiveTooLarge, ImageArchive, ImportRowError, detect_format, iter_records, normalize_record
+)
 
 
 
-# Logger setup
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename="backend.log",
-    filemode="a",
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Load environment variables
+load_dotenv()
+
+# Logger setup (記録はキューに積み、整形と書き込みは別スレッド。設定は環境変数で変える)
+#   LOG_LEVELS: ロガーごとのレベル (例: "walkaudit.access=WARNING,sqlalchemy.engine=INFO")
+#   LOG_REQUEST_SAMPLE_RATE: リクエストごとのアクセスログを残す割合 (5xx と遅いリクエストは常に残す)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "backend.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_STDERR = os.getenv("LOG_STDERR", "1") == "1"
+LOG_LEVELS = parse_levels(os.getenv("LOG_LEVELS", "uvicorn.access=WARNING"))
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", 0.05))
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", 1000))
+setup_logging(
+    level=LOG_LEVEL,
+    filename=LOG_FILE or None,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    fmt=LOG_FORMAT,
+    levels=LOG_LEVELS,
+    stderr=LOG_STDERR,
 )
-logger = logging.getLogger(__name__)
 logger = logging.getLogger("uvicorn.error")
+access_logger = logging.getLogger("walkaudit.access")
+access_logger.addFilter(SamplingFilter(LOG_REQUEST_SAMPLE_RATE))
 logger.info("Starting FastAPI application")
 
-# Load environment variables
-load_dotenv()
 SECRET = os.getenv("JWT_SECRET", "your_jwt_secret_here")
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///./walkaudit.db")
 ALGORITHM = "HS256"
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@example.com")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "adminpass123")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_REQUEST_UPLOAD_BYTES = int(os.getenv("MAX_REQUEST_UPLOAD_BYTES", 40 * 1024 * 1024))
+# multipart の本文の上限 = ファイルの上限 + 区切りやテキスト項目の分。超えたら本文を読み切る前に 413 を返す
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+# 一括取り込みの本文の上限と、画像 zip の展開後の合計サイズの上限 (画像は圧縮済みなので同じ値を使う)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 512 * 1024 * 1024))
+SYNC_MAX_ITEMS = int(os.getenv("SYNC_MAX_ITEMS", 200))
+# 重複レポート判定: 同じカテゴリ・半径 DUPLICATE_RADIUS_M 以内・過去 DUPLICATE_WINDOW_DAYS 日以内の未解決レポート
+#   DUPLICATE_ACTION=link なら status を duplicate にして元レポートに紐付け、flag なら紐付けだけ行う (off で無効)
+DUPLICATE_RADIUS_M = float(os.getenv("DUPLICATE_RADIUS_M", 30))
+DUPLICATE_WINDOW_DAYS = float(os.getenv("DUPLICATE_WINDOW_DAYS", 14))
+DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "flag")
+EXPORT_TTL_HOURS = float(os.getenv("EXPORT_TTL_HOURS", 24))
+# Idempotency-Key の保存期間。これより後の再送は新しいレポートとして扱う
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", 24 * 7))
+# 監査ログはこの日数を過ぎたら LOG_ARCHIVE_DIR の gzip ファイルへ移す
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", 180))
+LOG_ARCHIVE_DIR = Path(os.getenv("LOG_ARCHIVE_DIR", BASE_DIR / "archive" / "logs"))
+# 時系列集計 (report_rollups) の時・日・月の区切りに使うタイムゾーン。変えたら rebuild_report_rollups で作り直す
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "Asia/Tokyo")
+STATS_TZ = ZoneInfo(STATS_TIMEZONE)
+UPLOAD_DIR = Path("static/uploads")
 from config import SECRET_KEY, ALGORITHM, DATABASE_URL, ADMIN_EMAIL
 logger.debug(f"⚙️ 環境変数読み込み: ADMIN_EMAIL={ADMIN_EMAIL!r}, ADMIN_PASSWORD={ADMIN_PASSWORD!r}")
 
@@ -112,6 +187,7 @@ class Area(Base):
     name = Column(String, nullable=False, unique=True)
     lat = Column(Float, nullable=True)
     lng = Column(Float, nullable=True)
+    boundary = Column(Text, nullable=True)  # GeoJSON Polygon / MultiPolygon
     organizations = relationship("Organization", secondary="organization_areas", back_populates="areas")
 
 class Category(Base):
@@ -153,7 +229,7 @@ class User(Base):
     user_type = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
     is_blocked = Column(Boolean, default=False)
-    org_id = Column(Integer, ForeignKey("organizations.id"))
+    org_id = Column(Integer, ForeignKey("organizations.id"), index=True)
     paypay_id = Column(String, nullable=True)
     name = Column(String, nullable=True)
     username = Column(String, nullable=True)
@@ -185,8 +261,13 @@ class Report(Base):
     created_at = Column(DateTime, default=lambda: datetime.datetime.now(timezone.utc))  # 修正
     rating = Column(Float, nullable=True)
     label = Column(String, default="unknown")
+    grid_cell = Column(Integer, nullable=True, index=True)  # utils/grid_index のセル番号
+    version = Column(Integer, default=1)  # 更新のたびに +1 (ETag 用)
+    updated_at = Column(DateTime, default=lambda: datetime.datetime.now(timezone.utc))
     org_id = Column(Integer, ForeignKey("organizations.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
+    duplicate_of = Column(Integer, ForeignKey("reports.id", ondelete="SET NULL"), nullable=True, index=True)
+    area_id = Column(Integer, ForeignKey("areas.id", ondelete="SET NULL"), nullable=True, index=True)  # 作成時 / rematch 時に判定したエリア
     org = relationship("Organization", back_populates="reports")
     user = relationship("User", back_populates="reports")
     images = relationship("Image", back_populates="report", cascade="all, delete-orphan")
@@ -194,6 +275,14 @@ class Report(Base):
     chats = relationship("Chat", back_populates="report")
     assignments = relationship("ReportAssignment", back_populates="report")
 
+    __table_args__ = (
+        Index("ix_reports_lat_lng", "lat", "lng"),
+        Index("ix_reports_created_at_id", "created_at", "id"),
+        Index("ix_reports_org_id_label", "org_id", "label"),
+        Index("ix_reports_category_grid_cell_created_at", "category", "grid_cell", "created_at"),
+        Index("ix_reports_user_id_created_at", "user_id", "created_at"),
+    )
+
     def to_geojson(self):
         return {
             "type": "Feature",
@@ -209,7 +298,11 @@ class Report(Base):
                 "status": self.status,
                 "created_at": self.created_at.isoformat(),
                 "address": self.address,
-                "image_paths": [img.image_path for img in self.images] if self.images else [],
+                "duplicate_of": self.duplicate_of,
+                # 一覧・地図向けにはサムネイル (未生成なら元画像)。元画像は original_image_paths
+                "image_paths": [img.thumb_path or img.image_path for img in self.images] if self.images else [],
+                "preview_image_paths": [img.preview_path or img.image_path for img in self.images] if self.images else [],
+                "original_image_paths": [img.image_path for img in self.images] if self.images else [],
                 "user": {
                     "id": self.user.id,
                     "name": self.user.name
@@ -222,6 +315,8 @@ class Image(Base):
     id = Column(Integer, primary_key=True)
     report_id = Column(Integer, ForeignKey("reports.id"), nullable=False)
     image_path = Column(String, nullable=False)
+    thumb_path = Column(String, nullable=True)
+    preview_path = Column(String, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.datetime.now(timezone.utc))  # 修正
     report = relationship("Report", back_populates="images")
 
@@ -234,13 +329,26 @@ class PayHistory(Base):
     user = relationship("User", back_populates="pay_history")
 
 class Log(Base):
+    # 監査ログ。action は表示用の文、user_id は操作したユーザー、event は操作の種類 (例: user.blocked)、
+    # target_type / target_id は操作対象。古い行は archive_logs で gzip ファイルへ移す
     __tablename__ = "logs"
     id = Column(Integer, primary_key=True)
     action = Column(String, nullable=False)
     timestamp = Column(DateTime, default=lambda: datetime.datetime.now(timezone.utc))  # 修正
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    event = Column(String, nullable=True)
+    target_type = Column(String, nullable=True)
+    target_id = Column(Integer, nullable=True)
+    details = Column(JSON, nullable=True)
     user = relationship("User")
 
+    __table_args__ = (
+        Index("ix_logs_timestamp", "timestamp"),
+        Index("ix_logs_user_id_id", "user_id", "id"),
+        Index("ix_logs_event_id", "event", "id"),
+        Index("ix_logs_target_type_target_id_id", "target_type", "target_id", "id"),
+    )
+
 class Notification(Base):
     __tablename__ = "notifications"
     id = Column(Integer, primary_key=True)
@@ -323,6 +431,81 @@ class OrgLink(Base):
     from_org = relationship("Organization", foreign_keys=[from_org_id])
     to_org = relationship("Organization", foreign_keys=[to_org_id])
 
+class UploadBlob(Base):
+    # static/uploads のファイルごとの参照数 (Image.image_path と ChatMessage.image から数える)
+    __tablename__ = "upload_blobs"
+    path = Column(String, primary_key=True)
+    refcount = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+class IdempotencyKey(Base):
+    # オフライン送信のリトライ対策。クライアントが振ったキーごとに最初の処理結果を保存する
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    report_id = Column(Integer, ForeignKey("reports.id"), nullable=True)
+    response = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ux_idempotency_keys_user_key", "user_id", "key", unique=True),
+    )
+
+class ExportJob(Base):
+    # 非同期エクスポートの状態 (queued → running → done / failed)。ファイルは cache/exports に置く
+    __tablename__ = "export_jobs"
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    format = Column(String, nullable=False, default="csv")
+    filters = Column(Text, nullable=False)  # JSON
+    status = Column(String, nullable=False, default="queued")
+    total_rows = Column(Integer, nullable=True)
+    rows_written = Column(Integer, nullable=False, default=0)
+    file_size = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(timezone.utc))
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+class StatCounter(Base):
+    # 件数の集計値 (例: reports, reports:org:3:status:new, users, assignments:org:5)。
+    # 行の追加・更新・削除イベントで同じトランザクション内に増減し、reconcile_counters で実数と突き合わせる
+    __tablename__ = "stat_counters"
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+class ReportRollup(Base):
+    # レポート件数の時系列集計 (hour / day / month × org × area × category × status × label)。
+    # StatCounter と同じくレポートの追加・更新・削除で増減する。bucket は STATS_TIMEZONE での区間の開始時刻
+    __tablename__ = "report_rollups"
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    org_id = Column(Integer, nullable=True)
+    area_id = Column(Integer, nullable=True)
+    category = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    label = Column(String, nullable=True)
+    count = Column(Integer, nullable=False, default=0)
+    # 上の 7 列をまとめた一意キー (rollup_key())。次元は NULL を取りうるので、列の組では一意制約にできない
+    rollup_key = Column(String, nullable=True)
+    __table_args__ = (
+        Index(
+            "ix_report_rollups_bucket_dimensions",
+            "granularity", "bucket", "org_id", "area_id", "category", "status", "label",
+        ),
+        Index("ux_report_rollups_rollup_key", "rollup_key", unique=True),
+    )
+
+class ReportScopeVersion(Base):
+    # レポート一覧のまとまり (label / org / user) ごとの更新バージョン。一覧の ETag に使う
+    __tablename__ = "report_scope_versions"
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
 # Association tables
 organization_areas = Table(
     "organization_areas",
@@ -338,10 +521,515 @@ organization_categories = Table(
     Column("category_id", Integer, ForeignKey("categories.id"))
 )
 
+# lat/lng が変わるたびにグリッドセルを付け直し、列の変更があれば version を進める
+@event.listens_for(Report, "before_insert")
+def _stamp_new_report(mapper, connection, target):
+    target.grid_cell = cell_of(target.lat, target.lng)
+    target.version = 1
+    target.updated_at = datetime.datetime.now(timezone.utc)
+
+@event.listens_for(Report, "before_update")
+def _stamp_updated_report(mapper, connection, target):
+    target.grid_cell = cell_of(target.lat, target.lng)
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+        target.updated_at = datetime.datetime.now(timezone.utc)
+
+def _bump_report_scopes(connection, *snapshots):
+    # 同じトランザクション内でスコープごとのバージョンを進める。
+    # 全体で 1 行のスコープは全書き込みが同じ行を奪い合うので持たない (一覧はどれも label / org / user 単位)
+    scopes = set()
+    for snap in snapshots:
+        for kind, field in (("label", "label"), ("org", "org_id"), ("user", "user_id")):
+            if snap and snap.get(field) is not None:
+                scopes.add(f"{kind}:{snap[field]}")
+    table = ReportScopeVersion.__table__
+    now = datetime.datetime.now(timezone.utc)
+    for scope in sorted(scopes):
+        upsert_increment(connection, table, {"scope": scope}, "version", 1, updated_at=now)
+
+def _report_scope_row(connection, report_id):
+    row = connection.execute(
+        Report.__table__.select()
+        .with_only_columns(Report.label, Report.org_id, Report.user_id)
+        .where(Report.id == report_id)
+    ).first()
+    return dict(row._mapping) if row else None
+
+# 画像の追加・削除・サムネイル生成は一覧の内容 (image_paths) も変えるのでレポート側の version も進める
+@event.listens_for(Image, "after_insert")
+@event.listens_for(Image, "after_update")
+@event.listens_for(Image, "after_delete")
+def _image_changed(mapper, connection, target):
+    connection.execute(
+        Report.__table__.update()
+        .where(Report.id == target.report_id)
+        .values(version=func.coalesce(Report.version, 0) + 1, updated_at=datetime.datetime.now(timezone.utc))
+    )
+    _bump_report_scopes(connection, _report_scope_row(connection, target.report_id))
+
+# 共有先企業から見えるレポートが変わる
+@event.listens_for(ReportAssignment, "after_insert")
+@event.listens_for(ReportAssignment, "after_delete")
+def _assignment_changed(mapper, connection, target):
+    _bump_report_scopes(connection, {"label": None, "org_id": target.org_id, "user_id": None})
+    # レポート自体は変わらないので report_changes には載らない。共有先のタイルはコミット後に破棄する
+    point = connection.execute(
+        Report.__table__.select().with_only_columns(Report.lat, Report.lng).where(Report.id == target.report_id)
+    ).first()
+    session = object_session(target)
+    if point and point.lat is not None and point.lng is not None and session is not None:
+        session.info.setdefault("assignment_points", []).append((point.lat, point.lng))
+
+# レポートの追加・更新・削除をコミット後に通知する (プロセス内インデックス用)
+REPORT_SNAPSHOT_FIELDS = ("id", "lat", "lng", "status", "category", "label", "org_id", "user_id", "area_id", "created_at")
+report_change_listeners = []
+
+# コミット後 (期限切れ) のレポートに代入しても old スナップショットが取れるよう、代入時に旧値を読み込ませる
+for _field in REPORT_SNAPSHOT_FIELDS:
+    event.listen(getattr(Report, _field), "set", lambda *args: None, active_history=True)
+
+def _report_snapshot(target, old=False):
+    state = inspect(target)
+    snap = {}
+    for field in REPORT_SNAPSHOT_FIELDS:
+        history = state.attrs[field].history
+        snap[field] = history.deleted[0] if old and history.deleted else getattr(target, field)
+    return snap
+
+def _queue_report_change(target, old, new):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("report_changes", []).append((old, new))
+
+@event.listens_for(Report, "after_insert")
+def _report_inserted(mapper, connection, target):
+    new = _report_snapshot(target)
+    _bump_report_scopes(connection, new)
+    _queue_report_change(target, None, new)
+
+@event.listens_for(Report, "after_update")
+def _report_updated(mapper, connection, target):
+    state = inspect(target)
+    old, new = _report_snapshot(target, old=True), _report_snapshot(target)
+    if object_session(target).is_modified(target, include_collections=False):
+        _bump_report_scopes(connection, old, new)
+    if any(state.attrs[f].history.has_changes() for f in REPORT_SNAPSHOT_FIELDS):
+        _queue_report_change(target, old, new)
+
+@event.listens_for(Report, "after_delete")
+def _report_deleted(mapper, connection, target):
+    old = _report_snapshot(target, old=True)
+    _bump_report_scopes(connection, old)
+    _queue_report_change(target, old, None)
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_report_changes(session):
+    for old, new in session.info.pop("report_changes", []):
+        for listener in report_change_listeners:
+            try:
+                listener(old, new)
+            except Exception as e:
+                logger.error(f"Report change listener failed: {e}")
+
+# アップロードファイルの参照数を同じトランザクションで増減し、0 になったものはコミット後に消す。
+# 保存してからリクエストが終わるまでのファイルは upload_claims に載せ、同じ内容の削除と競合しないようにする
+upload_claims = UploadClaims()
+# 定期的に消す、upload_blobs に行の無いファイルの確認間隔 (秒)
+UPLOAD_SWEEP_INTERVAL = int(os.getenv("UPLOAD_SWEEP_INTERVAL", 24 * 3600))
+
+def upload_key(url: Optional[str]) -> Optional[str]:
+    key = url.lstrip("/") if url else None
+    return key if key and key.startswith(f"{UPLOAD_DIR.as_posix()}/") else None
+
+def _change_upload_ref(connection, target, url, delta):
+    key = upload_key(url)
+    if key is None:
+        return
+    table = UploadBlob.__table__
+    now = datetime.datetime.now(timezone.utc)
+    if delta > 0:
+        upsert_increment(connection, table, {"path": key}, "refcount", delta, updated_at=now)
+        return
+    result = connection.execute(
+        table.update().where(table.c.path == key).values(refcount=table.c.refcount + delta, updated_at=now)
+    )
+    session = object_session(target)
+    if result.rowcount and session is not None:
+        session.info.setdefault("released_uploads", set()).add(key)
+
+def _track_upload_refs(model, attr):
+    @event.listens_for(model, "after_insert")
+    def _ref_added(mapper, connection, target):
+        _change_upload_ref(connection, target, getattr(target, attr), 1)
+
+    @event.listens_for(model, "after_delete")
+    def _ref_removed(mapper, connection, target):
+        _change_upload_ref(connection, target, getattr(target, attr), -1)
+
+    @event.listens_for(model, "after_update")
+    def _ref_changed(mapper, connection, target):
+        history = inspect(target).attrs[attr].history
+        for url in history.deleted:
+            _change_upload_ref(connection, target, url, -1)
+        for url in history.added:
+            _change_upload_ref(connection, target, url, 1)
+
+_track_upload_refs(Image, "image_path")
+_track_upload_refs(ChatMessage, "image")
+
+def remove_unreferenced_upload(key: str) -> bool:
+    # 参照数 0 の行を消したトランザクションの中 (行ロックを持ったまま) でファイルも消す。
+    # 参照を書く側はその行の UPSERT で待たされるので、消した後に付いた参照は新しい行になる
+    table = UploadBlob.__table__
+    with engine.begin() as conn:
+        deleted = conn.execute(table.delete().where(table.c.path == key, table.c.refcount <= 0)).rowcount
+        if not deleted and conn.execute(table.select().where(table.c.path == key)).first() is not None:
+            return False
+        with upload_claims.lock:
+            # 同じ内容を保存したばかりのリクエストがあれば、そちらが参照を書くので残す
+            if upload_claims.is_claimed(key):
+                return False
+            for path in [Path(key), *derivative_paths(key)]:
+                path.unlink(missing_ok=True)
+    logger.debug(f"Removed unreferenced upload: {key}")
+    return True
+
+def hold_uploads(db: Session, keys):
+    # 保存したファイルをこのセッション (= 1 リクエスト) が終わるまで claim したままにする
+    db.info.setdefault("held_uploads", []).extend(keys)
+
+def settle_uploads(db: Session):
+    # リクエストの終わり (get_db) に claim を外し、コミットされた参照の付かなかったファイルを消す。
+    # 途中の例外・ロールバック・後続のファイルでの 413 などで参照を書けなかった分もここで片付く
+    keys = db.info.pop("held_uploads", [])
+    for key in keys:
+        upload_claims.release(key)
+    for key in dict.fromkeys(keys):
+        try:
+            remove_unreferenced_upload(key)
+        except Exception as e:
+            logger.error(f"Failed to remove upload {key}: {e}")
+
+def sweep_orphan_uploads(min_age: Optional[float] = None) -> int:
+    """UPLOAD_DIR のファイルのうち upload_blobs に行が無く claim もされていないもの (と元画像の無い派生画像、
+    書きかけの .part) を消し、消したファイル数を返す。書き込み中を避けるため min_age 秒以内に更新されたものは見ない"""
+    cutoff = time.time() - (upload_claims.ttl if min_age is None else min_age)
+    originals, derivatives, removed = [], [], 0
+    for path in UPLOAD_DIR.rglob("*"):
+        if not path.is_file() or path.stat().st_mtime > cutoff:
+            continue
+        if path.suffix == ".part":
+            path.unlink(missing_ok=True)
+            removed += 1
+        elif path.stem.rpartition("_")[2] in DERIVATIVE_SIZES:
+            derivatives.append(path)
+        else:
+            originals.append(path.as_posix())
+    table = UploadBlob.__table__
+    known = set()
+    with engine.connect() as conn:
+        for chunk in _id_chunks(originals):
+            known.update(conn.execute(select(table.c.path).where(table.c.path.in_(chunk))).scalars())
+    for key in originals:
+        if key not in known and remove_unreferenced_upload(key):
+            removed += 1
+    for path in derivatives:
+        base = path.stem.rpartition("_")[0]
+        if not any(p.stem == base for p in path.parent.glob(f"{glob.escape(base)}.*")):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+@event.listens_for(Session, "after_commit")
+def _remove_released_uploads(session):
+    for key in session.info.pop("released_uploads", ()):
+        try:
+            remove_unreferenced_upload(key)
+        except Exception as e:
+            logger.error(f"Failed to remove upload {key}: {e}")
+
+# 件数カウンター。キーの組み立てはモデルごと、増減は apply_counter_deltas にまとめる
+REPORT_COUNTER_DIMENSIONS = ("status", "category", "label")
+
+def report_counter_keys(values: dict) -> List[str]:
+    prefixes = ["reports"]
+    for kind, field in (("org", "org_id"), ("area", "area_id")):
+        if values.get(field) is not None:
+            prefixes.append(f"reports:{kind}:{values[field]}")
+    keys = []
+    for prefix in prefixes:
+        keys.append(prefix)
+        keys.extend(f"{prefix}:{dim}:{values[dim]}" for dim in REPORT_COUNTER_DIMENSIONS if values.get(dim) is not None)
+    return keys
+
+def user_counter_keys(values: dict) -> List[str]:
+    keys = ["users"]
+    if values.get("org_id") is not None:
+        keys.append(f"users:org:{values['org_id']}")
+    if values.get("user_type"):
+        keys.append(f"users:type:{values['user_type']}")
+    return keys
+
+def organization_counter_keys(values: dict) -> List[str]:
+    return ["organizations", f"organizations:{'company' if values.get('is_company') else 'city'}"]
+
+def assignment_counter_keys(values: dict) -> List[str]:
+    keys = ["assignments", f"assignments:org:{values['org_id']}"]
+    if values.get("status"):
+        keys += [f"assignments:status:{values['status']}", f"assignments:org:{values['org_id']}:status:{values['status']}"]
+    return keys
+
+def apply_counter_deltas(connection, deltas):
+    table = StatCounter.__table__
+    now = datetime.datetime.now(timezone.utc)
+    for key, delta in sorted(deltas.items()):
+        if delta:
+            upsert_increment(connection, table, {"key": key}, "value", delta, updated_at=now)
+
+def _track_counters(model, keys_for, fields, apply=apply_counter_deltas):
+    # 期限切れのインスタンスに代入しても旧値が history に残るよう、代入時に旧値を読み込ませる
+    for field in fields:
+        event.listen(getattr(model, field), "set", lambda *args: None, active_history=True)
+
+    def values(target, old=False):
+        state = inspect(target)
+        out = {}
+        for field in fields:
+            history = state.attrs[field].history
+            out[field] = history.deleted[0] if old and history.deleted else getattr(target, field)
+        return out
+
+    @event.listens_for(model, "after_insert")
+    def _counted_insert(mapper, connection, target):
+        apply(connection, Counter(keys_for(values(target))))
+
+    @event.listens_for(model, "after_delete")
+    def _counted_delete(mapper, connection, target):
+        deltas = Counter()
+        deltas.subtract(keys_for(values(target, old=True)))
+        apply(connection, deltas)
+
+    @event.listens_for(model, "after_update")
+    def _counted_update(mapper, connection, target):
+        state = inspect(target)
+        if not any(state.attrs[f].history.has_changes() for f in fields):
+            return
+        deltas = Counter(keys_for(values(target)))
+        deltas.subtract(keys_for(values(target, old=True)))
+        apply(connection, deltas)
+
+_track_counters(Report, report_counter_keys, ("org_id", "area_id", "status", "category", "label"))
+_track_counters(User, user_counter_keys, ("org_id", "user_type"))
+_track_counters(Organization, organization_counter_keys, ("is_company",))
+_track_counters(ReportAssignment, assignment_counter_keys, ("org_id", "status"))
+
+def compute_counters(db: Session) -> Counter:
+    # 実テーブルから GROUP BY で数え直す (reconcile 用)
+    counts = Counter()
+    dims = (Report.org_id, Report.area_id, Report.status, Report.category, Report.label)
+    for *row, n in db.query(*dims, func.count()).group_by(*dims):
+        for key in report_counter_keys(dict(zip(("org_id", "area_id", "status", "category", "label"), row))):
+            counts[key] += n
+    for org_id, user_type, n in db.query(User.org_id, User.user_type, func.count()).group_by(User.org_id, User.user_type):
+        for key in user_counter_keys({"org_id": org_id, "user_type": user_type}):
+            counts[key] += n
+    for is_company, n in db.query(Organization.is_company, func.count()).group_by(Organization.is_company):
+        for key in organization_counter_keys({"is_company": is_company}):
+            counts[key] += n
+    dims = (ReportAssignment.org_id, ReportAssignment.status)
+    for org_id, status, n in db.query(*dims, func.count()).group_by(*dims):
+        for key in assignment_counter_keys({"org_id": org_id, "status": status}):
+            counts[key] += n
+    return counts
+
+def reconcile_counters(db: Session, dry_run: bool = False) -> dict:
+    """カウンターを実数に合わせ、ずれていたキーを {key: (保存値, 実数)} で返す。
+    数え直しと書き戻しの間の更新は失われうるので、書き込みの少ない時間帯に実行する"""
+    actual = compute_counters(db)
+    stored = dict(db.query(StatCounter.key, StatCounter.value))
+    drift = {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in set(stored) | set(actual)
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+    if not dry_run and drift:
+        apply_counter_deltas(db.connection(), {key: new - old for key, (old, new) in drift.items()})
+        db.query(StatCounter).filter(StatCounter.value == 0).delete(synchronize_session=False)
+        db.commit()
+    return drift
+
+def read_counters(db: Session, keys) -> dict:
+    keys = list(keys)
+    values = dict(db.query(StatCounter.key, StatCounter.value).filter(StatCounter.key.in_(keys)))
+    return {key: values.get(key, 0) for key in keys}
+
+# 時系列集計。キーは (granularity, bucket, org_id, area_id, category, status, label)
+ROLLUP_COLUMNS = ("granularity", "bucket", "org_id", "area_id", "category", "status", "label")
+ROLLUP_DIMENSIONS = ROLLUP_COLUMNS[2:]
+
+def rollup_buckets(created_at: datetime.datetime) -> List[tuple]:
+    # DB から読んだ naive な値は UTC として扱う
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    hour = created_at.astimezone(STATS_TZ).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    return [("hour", hour), ("day", day), ("month", day.replace(day=1))]
+
+def report_rollup_keys(values: dict) -> List[tuple]:
+    if values.get("created_at") is None:
+        return []
+    dims = tuple(values.get(field) for field in ROLLUP_DIMENSIONS)
+    return [(granularity, bucket, *dims) for granularity, bucket in rollup_buckets(values["created_at"])]
+
+def rollup_key(key: tuple) -> str:
+    # None と空文字を区別できるよう JSON にする
+    granularity, bucket, *dims = key
+    return json.dumps([granularity, bucket.isoformat(), *dims], ensure_ascii=False)
+
+def apply_rollup_deltas(connection, deltas):
+    table = ReportRollup.__table__
+    for key, delta in sorted(deltas.items(), key=lambda item: str(item[0])):
+        if delta:
+            upsert_increment(
+                connection, table, {"rollup_key": rollup_key(key)}, "count", delta,
+                defaults=dict(zip(ROLLUP_COLUMNS, key)),
+            )
+
+_track_counters(Report, report_rollup_keys, ("created_at",) + ROLLUP_DIMENSIONS, apply=apply_rollup_deltas)
+
+def rebuild_report_rollups(db: Session) -> int:
+    """report_rollups を reports から作り直し、集計行数を返す (導入時・STATS_TIMEZONE 変更時)"""
+    counts = Counter()
+    rows = db.query(Report.created_at, *(getattr(Report, field) for field in ROLLUP_DIMENSIONS)).yield_per(5000)
+    for row in rows:
+        counts.update(report_rollup_keys(row._asdict()))
+    db.query(ReportRollup).delete(synchronize_session=False)
+    if counts:
+        db.execute(insert(ReportRollup), [
+            dict(zip(ROLLUP_COLUMNS, key), rollup_key=rollup_key(key), count=n) for key, n in counts.items()
+        ])
+    db.commit()
+    return len(counts)
+
+# 追加された画像はコミット後にサムネイルワーカーへ渡す
+@event.listens_for(Image, "after_insert")
+def _queue_new_image(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("new_images", []).append((target.id, target.image_path))
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_new_images(session):
+    for image_id, image_path in session.info.pop("new_images", []):
+        try:
+            thumbnail_worker.submit(image_id, image_path)
+        except Exception as e:
+            logger.error(f"Failed to queue thumbnail for image {image_id}: {e}")
+
+@event.listens_for(Session, "after_rollback")
+def _discard_report_changes(session):
+    session.info.pop("report_changes", None)
+    session.info.pop("new_images", None)
+    session.info.pop("released_uploads", None)
+    session.info.pop("areas_changed", None)
+    session.info.pop("assignment_points", None)
+
+# エリア名やエリアと市組織の紐付けが変わったらエリアマッチャーを作り直す
+@event.listens_for(Session, "after_flush")
+def _mark_area_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Area) or (
+            isinstance(obj, Organization) and inspect(obj).attrs.areas.history.has_changes()
+        ):
+            session.info["areas_changed"] = True
+            return
+
+@event.listens_for(Session, "after_commit")
+def _rebuild_area_matcher(session):
+    if session.info.pop("areas_changed", False):
+        invalidate_area_matcher()
+        invalidate_area_index()
+
 # Create database tables
 Base.metadata.create_all(bind=engine)
 logger.info("Database tables created")
 
+
+def ensure_schema():
+    # create_all は既存テーブルに列やインデックスを追加しないので、不足分だけ補う
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"
+                    ))
+                    logger.info(f"Added column {table.name}.{col.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+ensure_schema()
+
+# title / description / address の全文検索インデックス (sqlite は FTS5 トリガーで自動同期)
+report_search_mode = setup_report_search(engine)
+logger.info(f"Report search mode: {report_search_mode}")
+
+# 市向け地図のクラスタ集計 (低ズーム時に get_city_reports が使う)
+report_clusters = ClusterStore()
+report_change_listeners.append(report_clusters.update)
+
+def ensure_cluster_index(db: Session):
+    if not report_clusters.loaded:
+        rows = db.query(
+            Report.lat, Report.lng, Report.status, Report.category, Report.label
+        ).yield_per(5000)
+        report_clusters.load(dict(r._mapping) for r in rows)
+
+# cursor モードの get_city_reports が返すおおよその総件数 (レポート変更時と TTL で破棄)
+city_report_counts = TTLCache(ttl=60)
+report_change_listeners.append(city_report_counts.clear)
+
+# 密度ヒートマップ (フィルター x 解像度ごとの集計を保持し、レポートの増減をセル単位で反映)
+heatmap_store = HeatmapStore()
+report_change_listeners.append(heatmap_store.update)
+
+def load_heatmap_points(db: Session, filters: dict) -> np.ndarray:
+    query = db.query(Report.lat, Report.lng).filter(Report.lat.isnot(None), Report.lng.isnot(None))
+    for field, value in filters.items():
+        if value is not None:
+            query = query.filter(getattr(Report, field) == value)
+    return np.array(query.all(), dtype=np.float64).reshape(-1, 2)
+
+# レポートレイヤーのベクタータイルキャッシュ (レポートのあるタイルだけ破棄)
+tile_cache = TileCache(BASE_DIR / "cache" / "tiles" / "reports")
+report_change_listeners.append(tile_cache.on_report_change)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_assignment_tiles(session):
+    for lat, lng in session.info.pop("assignment_points", []):
+        try:
+            tile_cache.invalidate_point(lat, lng)
+        except Exception as e:
+            logger.error(f"Tile invalidation failed: {e}")
+
+# 画像のサムネイル / プレビュー生成 (別プロセス)。結果は Image 行に記録する
+def record_image_derivatives(image_id: int, paths: dict):
+    with SessionLocal() as db:
+        image = db.get(Image, image_id)
+        if image is None:
+            return
+        image.thumb_path = paths.get("thumb")
+        image.preview_path = paths.get("preview")
+        db.commit()
+    logger.debug(f"Derivatives recorded for image {image_id}: {paths}")
+
+thumbnail_worker = ThumbnailWorker(record_image_derivatives)
+
 # Pydantic Models
 class AreaCreate(BaseModel):
     name: str
@@ -572,6 +1260,7 @@ def get_db():
         yield db
     finally:
         db.close()
+        settle_uploads(db)
 
 def create_token(user: User) -> str:
     payload = {
@@ -583,7 +1272,7 @@ def create_token(user: User) -> str:
         "exp": datetime.datetime.now(timezone.utc) + datetime.timedelta(days=7)
     }
     token = jwt.encode(payload, SECRET, algorithm=ALGORITHM)
-    logger.debug(f"Created JWT for user {user.id}")
+    logger.debug("Created JWT for user %s", user.id)
     return token
 
 def create_access_token(data: dict, expires_delta: datetime.timedelta):
@@ -607,7 +1296,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         if user.is_blocked:
             logger.warning(f"User {user.id} is blocked")
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is blocked")
-        logger.debug(f"Current user: {user.email}")
+        logger.debug("Current user: %s", user.email)
         return user
     except JWTError as e:
         logger.error(f"JWT decode error: {str(e)}")
@@ -672,6 +1361,57 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
 # FastAPI instance
 logger.info("FastAPI instance initialized")
 
+
+class UploadSizeLimitMiddleware:
+    """multipart リクエストの本文が max_bytes (path_limits にあるパスはその値) を超えたら 413 を返す。
+    Content-Length があれば読み込む前に、無ければ (chunked) 受信中に数えて打ち切る。
+    Starlette はフォームを解析するときに本文全体をスプールするので、ハンドラーでの検査より前に止める"""
+
+    def __init__(self, app, max_bytes: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = dict(path_limits or {})
+
+    @staticmethod
+    def _too_large(max_bytes: int):
+        return HTTPException(status_code=413, detail=f"アップロードサイズが上限 ({max_bytes} bytes) を超えています")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > max_bytes:
+            exc = self._too_large(max_bytes)
+            upload_metrics.reject()
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            # FastAPI は本文の解析中の HTTPException をそのまま通すので、例外ハンドラーが 413 にする
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    upload_metrics.reject()
+                    raise self._too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# 一括取り込み (CSV + 画像 zip) は画像を行ごとに見るので、本文全体には別の上限を使う
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_REQUEST_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES,
+    path_limits={"/api/city/reports/import": IMPORT_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES},
+)
+
 # CORS setup
 app.add_middleware(
     CORSMiddleware,
@@ -679,9 +1419,93 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 logger.info("CORS middleware configured")
 
+# 監査ログ。操作と同じトランザクションで 1 行追加する (ロールバックされた操作は記録しない)
+def audit_log(
+    db: Session,
+    actor: Optional[User],
+    event: str,
+    action: str,
+    target_type: Optional[str] = None,
+    target_id: Optional[int] = None,
+    **details,
+) -> Log:
+    log = Log(
+        action=action,
+        user_id=actor.id if actor else None,
+        event=event,
+        target_type=target_type,
+        target_id=target_id,
+        details=details or None,
+    )
+    db.add(log)
+    return log
+
+def serialize_log(log: Log) -> dict:
+    return {
+        "id": log.id,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+        "action": log.action,
+        "event": log.event,
+        "actor_id": log.user_id,
+        "target_type": log.target_type,
+        "target_id": log.target_id,
+        "details": log.details,
+    }
+
+def _recover_log_archives(db: Session):
+    # 前回の途中で残った .part を片付ける。行の削除がコミット済み (id が 1 件も残っていない) なら正式なファイルにし、
+    # そうでなければ消す (その行は今回もう一度書き出される)
+    for part in sorted(LOG_ARCHIVE_DIR.glob("logs-*.ndjson.gz.part")):
+        try:
+            with gzip.open(part, "rt", encoding="utf-8") as f:
+                ids = [json.loads(line)["id"] for line in f if line.strip()]
+        except (OSError, EOFError, ValueError, KeyError):
+            ids = None
+        committed = ids is not None and not any(
+            db.query(Log.id).filter(Log.id.in_(chunk)).first() for chunk in _id_chunks(ids)
+        )
+        if committed and ids:
+            os.replace(part, part.with_suffix(""))
+            logger.info(f"Recovered audit log archive {part.with_suffix('').name}")
+        else:
+            part.unlink()
+
+def archive_logs(older_than_days: float = LOG_RETENTION_DAYS, batch_size: int = 10000, dry_run: bool = False) -> int:
+    """older_than_days より古い監査ログを LOG_ARCHIVE_DIR/logs-<最初の id>-<最後の id>.ndjson.gz に書き出してから削除する。
+    ファイルは .part に書き、行の削除をコミットしてから正式な名前にする。途中で落ちて残った .part は
+    次回の最初に、削除がコミット済みかどうかで正式なファイルにするか捨てるので、同じ行が 2 つのファイルに入らない"""
+    cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(days=older_than_days)
+    moved = 0
+    with SessionLocal() as db:
+        expired = db.query(Log).filter(Log.timestamp < cutoff)
+        if dry_run:
+            return expired.count()
+        LOG_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        _recover_log_archives(db)
+        while True:
+            batch = expired.order_by(Log.id).limit(batch_size).all()
+            if not batch:
+                break
+            path = LOG_ARCHIVE_DIR / f"logs-{batch[0].id:010d}-{batch[-1].id:010d}.ndjson.gz"
+            part = path.with_name(path.name + ".part")
+            with gzip.open(part, "wt", encoding="utf-8") as f:
+                for log in batch:
+                    f.write(json.dumps(serialize_log(log), ensure_ascii=False) + "\n")
+            try:
+                db.query(Log).filter(Log.id.in_([log.id for log in batch])).delete(synchronize_session=False)
+                db.commit()
+            except Exception:
+                db.rollback()
+                part.unlink(missing_ok=True)
+                raise
+            os.replace(part, path)
+            moved += len(batch)
+    return moved
+
 # Routers
 city_router = APIRouter(
     prefix="/api/city",
@@ -860,10 +1684,22 @@ def post_filter_cities(payload: dict, db: Session = Depends(get_db), current_use
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.debug(f"Request: {request.method} {request.url}")
+    # 1 リクエスト 1 行。INFO は LOG_REQUEST_SAMPLE_RATE で間引き、5xx と遅いリクエストは WARNING で必ず残す
+    started = time.perf_counter()
     try:
         response = await call_next(request)
-        logger.debug(f"Response status: {response.status_code}")
+        duration_ms = (time.perf_counter() - started) * 1000
+        level = logging.WARNING if response.status_code >= 500 or duration_ms >= LOG_SLOW_REQUEST_MS else logging.INFO
+        if access_logger.isEnabledFor(level):
+            access_logger.log(
+                level, "%s %s %s %.1fms", request.method, request.url.path, response.status_code, duration_ms,
+                extra={
+                    "method": request.method,
+                    "path": request.url.path,
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 1),
+                },
+            )
         return response
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
@@ -901,15 +1737,43 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 
 # Utility Functions
-def save_upload(file: UploadFile) -> str:
-    uploads = Path("static/uploads")
-    uploads.mkdir(parents=True, exist_ok=True)
-    fname = f"{uuid.uuid4()}{Path(file.filename).suffix}"
-    path = uploads / fname
-    with open(path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    logger.debug(f"File saved: {path}")
-    return str(path)
+upload_metrics = UploadMetrics()
+
+
+async def store_upload_file(file: UploadFile, db: Session, budget: Optional[UploadBudget] = None):
+    # 書き込みはスレッドプールで行い、イベントループを塞がない。保存先は内容の SHA-256 で決まる。
+    # 参照が書かれるまでの削除から守るため、db のリクエストが終わるまで claim しておく
+    try:
+        stored = await run_in_threadpool(
+            store_upload,
+            file.file,
+            UPLOAD_DIR,
+            Path(file.filename or "").suffix,
+            MAX_UPLOAD_BYTES,
+            budget,
+            upload_claims,
+        )
+    except UploadTooLarge as e:
+        upload_metrics.reject()
+        raise HTTPException(status_code=413, detail=f"アップロードサイズが上限 ({e.limit} bytes) を超えています")
+    hold_uploads(db, [stored.path.as_posix()])
+    upload_metrics.record(stored)
+    rate = stored.size / stored.seconds if stored.seconds else 0
+    logger.debug(
+        f"File saved: {stored.path} size={stored.size} sha256={stored.sha256} duplicate={stored.duplicate} "
+        f"elapsed={stored.seconds * 1000:.1f}ms rate={rate / 1e6:.2f}MB/s"
+    )
+    return stored
+
+
+async def save_upload(file: UploadFile, db: Session, budget: Optional[UploadBudget] = None) -> str:
+    return (await store_upload_file(file, db, budget)).path.as_posix()
+
+
+async def save_uploads(files: List[UploadFile], db: Session) -> List[str]:
+    """複数ファイルをリクエスト単位の上限付きで保存する。途中で失敗したときに書いた分は settle_uploads が片付ける"""
+    budget = UploadBudget(MAX_REQUEST_UPLOAD_BYTES)
+    return [await save_upload(file, db, budget) for file in files]
 
 def get_user_by_email(email: str, db: Session) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
@@ -967,6 +1831,238 @@ def classify_label(value: str | None) -> str:
     ]
     return "city" if value in city_values else "company"
 
+
+def load_area_boundaries(db: Session):
+    areas = db.query(Area).filter(Area.boundary.isnot(None)).all()
+    return [(a.id, find_city_org_id(a), a.boundary) for a in areas]
+
+
+def match_area(
+    address: Optional[str], db: Session, lat: Optional[float] = None, lng: Optional[float] = None
+) -> Optional[tuple]:
+    # 境界ポリゴンに含まれていればそれを優先し、なければ住所の文字列一致で決める。(area_id, city_org_id) を返す。
+    # ポリゴンのエリアに市組織が紐付いていないときは、市組織だけ住所の文字列一致で補う
+    match = None
+    if lat is not None and lng is not None:
+        match = get_area_index(lambda: load_area_boundaries(db)).locate(lat, lng)
+        if match and match[1] is not None:
+            return match
+    text_match = get_area_matcher(lambda: load_area_rows(db, Area)).match(address)
+    if match:
+        return match[0], text_match[1] if text_match else None
+    return text_match
+
+
+def match_city_org_id(
+    address: Optional[str], db: Session, lat: Optional[float] = None, lng: Optional[float] = None
+) -> Optional[int]:
+    match = match_area(address, db, lat, lng)
+    return match[1] if match else None
+
+
+def rematch_report_orgs(db: Session, batch_size: int = 1000, dry_run: bool = False) -> int:
+    # レポートのエリアと、市ラベルのレポートの振り分け先を現在のエリア定義で付け直す (create_report と同じ規則)
+    changed = 0
+    last_id = 0
+    while True:
+        batch = (
+            db.query(Report)
+              .filter(Report.id > last_id)
+              .order_by(Report.id)
+              .limit(batch_size)
+              .all()
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        user_orgs = dict(
+            db.query(User.id, User.org_id).filter(User.id.in_({r.user_id for r in batch})).all()
+        )
+        for report in batch:
+            match = match_area(report.address, db, report.lat, report.lng)
+            area_id = match[0] if match else None
+            org_id = report.org_id
+            if report.label == "city":
+                org_id = (match[1] if match else None) or user_orgs.get(report.user_id)
+            if (org_id, area_id) != (report.org_id, report.area_id):
+                changed += 1
+                if not dry_run:
+                    report.org_id = org_id
+                    report.area_id = area_id
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+        db.expunge_all()
+    return changed
+
+
+def detach_area_reports(db: Session, area_ids: Optional[List[int]] = None, batch_size: int = 1000) -> int:
+    # エリアを消す前に、そのエリア (None なら全エリア) のレポートの area_id を外す。
+    # ORM で更新するので集計カウンターと時系列集計も付け替わる。コミットは呼び出し側
+    query = db.query(Report).filter(Report.area_id.isnot(None) if area_ids is None else Report.area_id.in_(area_ids))
+    detached = 0
+    last_id = 0
+    while True:
+        batch = query.filter(Report.id > last_id).order_by(Report.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for report in batch:
+            report.area_id = None
+        db.flush()
+        detached += len(batch)
+    return detached
+
+
+def scope_reports_for_user(query, user: User, db: Session):
+    # get_city_reports / get_company_reports / get_reports と同じ見え方に絞り込む
+    if user.is_admin or user.user_type == "admin":
+        return query
+    if user.role == "city" or user.user_type == "city":
+        return query.filter(Report.label == "city")
+    if user.user_type == "company":
+        shared = exists().where(
+            ReportAssignment.report_id == Report.id,
+            ReportAssignment.org_id == user.org_id,
+        )
+        return query.filter(or_(
+            and_(Report.org_id == user.org_id, Report.label == "company"),
+            shared,
+        ))
+    return query.filter(Report.user_id == user.id)
+
+
+def report_scope_key(user: User) -> Optional[str]:
+    # scope_reports_for_user で同じ結果になるユーザーのまとまり (個人単位はキャッシュしない)
+    if user.is_admin or user.user_type == "admin":
+        return "admin"
+    if user.role == "city" or user.user_type == "city":
+        return "city"
+    if user.user_type == "company" and user.org_id:
+        return f"org-{user.org_id}"
+    return None
+
+
+def _id_chunks(ids, size=500):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def load_report_images(db: Session, report_ids) -> dict:
+    images = defaultdict(list)
+    for chunk in _id_chunks(report_ids):
+        for img in db.query(Image).filter(Image.report_id.in_(chunk)).order_by(Image.id):
+            images[img.report_id].append(img)
+    return images
+
+
+def serialize_reports(db: Session, reports) -> List[dict]:
+    # to_geojson() を一覧用にまとめて実行する。画像とユーザーはページ全体で 1 クエリずつ
+    reports = [r for r in reports if r is not None]
+    images = load_report_images(db, {r.id for r in reports})
+    users = {}
+    for chunk in _id_chunks({r.user_id for r in reports if r.user_id}):
+        users.update({u.id: u for u in db.query(User).filter(User.id.in_(chunk))})
+    for r in reports:
+        set_committed_value(r, "images", images.get(r.id, []))
+        set_committed_value(r, "user", users.get(r.user_id))
+    return [r.to_geojson() for r in reports]
+
+
+def apply_report_search(query, search: str, columns=SEARCH_COLUMNS, relevance: bool = False):
+    # 全文検索インデックスで絞り込む。relevance=True なら一致度の高い順に並べる
+    if report_search_mode == "fts5":
+        match = fts_match_expression(search, None if tuple(columns) == SEARCH_COLUMNS else columns)
+        if match:
+            hits = (
+                text(f"SELECT rowid AS id, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+                .bindparams(match=match)
+                .columns(id=Integer, rank=Float)
+                .subquery()
+            )
+            query = query.join(hits, hits.c.id == Report.id)
+            return query.order_by(hits.c.rank) if relevance else query
+    # trigram で引けない短い語などは ILIKE (postgres では pg_trgm インデックスが効く)。語に分けず全体を 1 つの部分文字列として探す
+    cols = [getattr(Report, c) for c in columns]
+    pattern = f"%{search.strip()}%"
+    query = query.filter(or_(*[c.ilike(pattern) for c in cols]))
+    if relevance and report_search_mode == "trgm":
+        query = query.order_by(func.greatest(
+            *[func.word_similarity(search, func.coalesce(c, "")) for c in cols]
+        ).desc())
+    return query
+
+
+def scope_etag(db: Session, scopes: List[str], *parts):
+    # スコープのバージョンとリクエスト条件から強い ETag を作る
+    rows = db.query(ReportScopeVersion).filter(ReportScopeVersion.scope.in_(scopes)).all()
+    versions = {r.scope: r for r in rows}
+    key = "|".join(
+        [f"{s}:{versions[s].version if s in versions else 0}" for s in scopes] + [str(p) for p in parts]
+    )
+    stamps = [r.updated_at for r in rows if r.updated_at]
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"', max(stamps) if stamps else None
+
+
+def conditional_response(request: Request, response: Response, etag: str, last_modified=None) -> Optional[Response]:
+    # ETag / Last-Modified を付け、クライアントの版と同じなら 304 を返す
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+        return None
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            if last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since):
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def encode_report_cursor(report) -> str:
+    raw = json.dumps([report.created_at.isoformat(), report.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def apply_report_cursor(query, cursor: Optional[str]):
+    # created_at DESC, id DESC の並びで cursor より後ろだけに絞る (keyset pagination)
+    query = query.order_by(Report.created_at.desc(), Report.id.desc())
+    if not cursor:
+        return query
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, report_id = json.loads(raw)
+        created_at = datetime.datetime.fromisoformat(created_at)
+        report_id = int(report_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return query.filter(or_(
+        Report.created_at < created_at,
+        and_(Report.created_at == created_at, Report.id < report_id),
+    ))
+
+
+def filter_reports_in_bbox(query, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    ranges = cell_ranges(min_lat, min_lng, max_lat, max_lng)
+    if ranges is not None:
+        # 行ごとのセル範囲で grid_cell インデックスを引き、境界セルは lat/lng で厳密に判定
+        query = query.filter(or_(*[Report.grid_cell.between(lo, hi) for lo, hi in ranges]))
+    return query.filter(
+        Report.lat.between(min_lat, max_lat),
+        Report.lng.between(min_lng, max_lng),
+    )
+
 # WebSocket clients
 websocket_clients = {}
 
@@ -1151,7 +2247,7 @@ async def login(form_data: Login, db: Session = Depends(get_db)):
 
 @app.get("/auth/me")
 async def get_current_user_info(user: User = Depends(get_current_user), local_kw: Optional[str] = Query(None)):
-    logger.debug(f"Fetching user info for user ID: {user.id}")
+    logger.debug("Fetching user info for user ID: %s", user.id)
     user_type = (
         "admin" if user.is_admin or user.user_type == "admin" else
         "city" if user.role == "city" or user.user_type == "city" else
@@ -1376,6 +2472,7 @@ def delete_area(area_id: int, user: User = Depends(city_required), db: Session =
     area = db.query(Area).filter(Area.id == area_id).first()
     if not area:
         raise HTTPException(status_code=404, detail="Area not found")
+    detach_area_reports(db, [area.id])
     db.delete(area)
     db.commit()
     return {"message": "Area deleted"}
@@ -1392,6 +2489,8 @@ def get_city_companies(db: Session = Depends(get_db)):
 
 @city_router.get("/reports")
 def get_city_reports(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1),
     category: Optional[str] = Query(None),
@@ -1401,9 +2500,23 @@ def get_city_reports(
     search: Optional[str] = Query(None),
     # ここでフロントが投げている パラメータ名 を受け取る
     areaKeywords: Optional[str] = Query(None, alias="areaKeywords"),
+    # zoom が CLUSTER_MAX_ZOOM 以下ならクラスタを返す
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    minLng: Optional[float] = Query(None),
+    minLat: Optional[float] = Query(None),
+    maxLng: Optional[float] = Query(None),
+    maxLat: Optional[float] = Query(None),
+    cursor: Optional[str] = Query(None),
+    # "relevance" で検索一致度順 (cursor モードでは作成日時順のみ)
+    sort: Optional[str] = Query(None, regex="^(created_at|relevance)$"),
     db: Session = Depends(get_db),
     user: User = Depends(city_required),
 ):
+    etag, last_modified = scope_etag(db, ["label:city"], request.url.query)
+    cached = conditional_response(request, response, etag, last_modified)
+    if cached:
+        return cached
+
     query = db.query(Report).filter(Report.label == "city")
 
     # フロントから渡された selectedCities を優先して絞り込む
@@ -1428,11 +2541,35 @@ def get_city_reports(
     if date_to:
         query = query.filter(Report.created_at <= datetime.datetime.combine(date_to, datetime.time.max))
     if search:
-        query = query.filter(or_(
-            Report.title.ilike(f"%{search}%"),
-            Report.description.ilike(f"%{search}%"),
-            Report.address.ilike(f"%{search}%"),
-        ))
+        query = apply_report_search(query, search, relevance=sort == "relevance" and cursor is None)
+
+    if zoom is not None and zoom <= CLUSTER_MAX_ZOOM:
+        bbox = (minLng, minLat, maxLng, maxLat)
+        bbox = bbox if None not in bbox else None
+        if areaKeywords or date_from or date_to or search:
+            # 集計インデックスにない条件はその場で集計する
+            if bbox:
+                query = filter_reports_in_bbox(query, minLat, minLng, maxLat, maxLng)
+            rows = query.with_entities(Report.lat, Report.lng, Report.status).all()
+            features = ClusterIndex.from_points(rows, zoom).clusters(zoom)
+        else:
+            ensure_cluster_index(db)
+            features = report_clusters.clusters("city", category, zoom, bbox=bbox, status=status)
+        return {"features": features, "total_pages": 1, "clustered": True}
+
+    if cursor is not None:
+        # keyset pagination: ページの深さに関係なく一定コスト。総件数はキャッシュ値
+        reports = apply_report_cursor(query, cursor).limit(limit + 1).all()
+        has_more = len(reports) > limit
+        reports = reports[:limit]
+        count_key = (category, status, date_from, date_to, search, areaKeywords)
+        total = city_report_counts.get_or_set(count_key, query.count)
+        return {
+            "features": serialize_reports(db, reports),
+            "total_pages": (total + limit - 1) // limit,
+            "total": total,
+            "next_cursor": encode_report_cursor(reports[-1]) if has_more else None,
+        }
 
     total = query.count()
     reports = (
@@ -1443,7 +2580,7 @@ def get_city_reports(
     )
     total_pages = (total + limit - 1) // limit
     return {
-        "features": [r.to_geojson() for r in reports],
+        "features": serialize_reports(db, reports),
         "total_pages": total_pages,
     }
 
@@ -1478,9 +2615,11 @@ def assign_report_to_companies(
     report.status = "shared"
 
     # 操作ログ
-    db.add(Log(
-        action=f"Report {report_id} assigned to orgs {payload.company_ids} by city user {user.id}"
-    ))
+    audit_log(
+        db, user, "report.assigned",
+        f"Report {report_id} assigned to orgs {payload.company_ids} by city user {user.id}",
+        "report", report_id, org_ids=payload.company_ids,
+    )
 
     db.commit()
 
@@ -1490,9 +2629,134 @@ def assign_report_to_companies(
     }
 
 
+ROLLUP_GROUPS = {
+    "category": ReportRollup.category,
+    "status": ReportRollup.status,
+    "area": ReportRollup.area_id,
+    "org": ReportRollup.org_id,
+}
+# date_from を省略したときに返す期間
+ROLLUP_DEFAULT_SPANS = {
+    "hour": datetime.timedelta(days=2),
+    "day": datetime.timedelta(days=30),
+    "month": datetime.timedelta(days=365),
+}
+
+@city_router.get("/stats/timeseries")
+def city_stats_timeseries(
+    request: Request,
+    response: Response,
+    granularity: str = Query("day", regex="^(hour|day|month)$"),
+    date_from: Optional[datetime.date] = Query(None),
+    date_to: Optional[datetime.date] = Query(None),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    area_id: Optional[int] = Query(None),
+    org_id: Optional[int] = Query(None),
+    group_by: Optional[str] = Query(None, regex="^(category|status|area|org)$"),
+    db: Session = Depends(get_db),
+    user: User = Depends(city_required),
+):
+    # report_rollups だけを読むので、件数はバケット数 × グループ数にしか依存しない
+    etag, last_modified = scope_etag(db, ["label:city"], request.url.query)
+    cached = conditional_response(request, response, etag, last_modified)
+    if cached:
+        return cached
+
+    date_to = date_to or datetime.datetime.now(STATS_TZ).date()
+    date_from = date_from or date_to - ROLLUP_DEFAULT_SPANS[granularity]
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must be on or before date_to")
+    if granularity == "month":
+        date_from = date_from.replace(day=1)
+
+    group = ROLLUP_GROUPS.get(group_by)
+    columns = [ReportRollup.bucket] + ([group] if group is not None else [])
+    query = db.query(*columns, func.sum(ReportRollup.count)).filter(
+        ReportRollup.granularity == granularity,
+        ReportRollup.label == "city",
+        ReportRollup.bucket >= datetime.datetime.combine(date_from, datetime.time.min),
+        ReportRollup.bucket < datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min),
+    )
+    if category:
+        query = query.filter(ReportRollup.category == category)
+    if status:
+        query = query.filter(ReportRollup.status == status)
+    if area_id is not None:
+        query = query.filter(ReportRollup.area_id == area_id)
+    if org_id is not None:
+        query = query.filter(ReportRollup.org_id == org_id)
+
+    series = defaultdict(list)
+    for bucket, *key, count in query.group_by(*columns).order_by(*columns):
+        if count:
+            series[key[0] if key else None].append(
+                {"bucket": bucket.replace(tzinfo=STATS_TZ).isoformat(), "count": int(count)}
+            )
+    return {
+        "granularity": granularity,
+        "timezone": STATS_TIMEZONE,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "groupBy": group_by,
+        "series": [{"key": key, "points": points} for key, points in series.items()],
+    }
+
+@city_router.get("/heatmap")
+def city_heatmap(
+    request: Request,
+    response: Response,
+    minLng: float = Query(..., ge=-180, le=180),
+    minLat: float = Query(..., ge=-90, le=90),
+    maxLng: float = Query(..., ge=-180, le=180),
+    maxLat: float = Query(..., ge=-90, le=90),
+    cell_size: float = Query(0.01),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    org_id: Optional[int] = Query(None),
+    format: str = Query("grid", regex="^(grid|geojson)$"),
+    db: Session = Depends(get_db),
+    user: User = Depends(city_required),
+):
+    # 全レポートの座標を返す代わりに、固定グリッドの件数だけを返す
+    if cell_size not in HEATMAP_CELL_SIZES:
+        raise HTTPException(status_code=400, detail=f"cell_size must be one of {list(HEATMAP_CELL_SIZES)}")
+    if minLng > maxLng or minLat > maxLat:
+        raise HTTPException(status_code=400, detail="Invalid bbox")
+    etag, last_modified = scope_etag(db, ["label:city"], request.url.query)
+    cached = conditional_response(request, response, etag, last_modified)
+    if cached:
+        return cached
+
+    filters = {"label": "city", "org_id": org_id, "category": category, "status": status}
+    try:
+        origin, dense = heatmap_store.grid(
+            filters, cell_size, (minLng, minLat, maxLng, maxLat), lambda: load_heatmap_points(db, filters)
+        )
+    except GridTooLarge as e:
+        raise HTTPException(status_code=400, detail=f"{e}; use a larger cell_size or a smaller bbox")
+
+    if format == "geojson":
+        return {"type": "FeatureCollection", "features": grid_features(origin, dense, cell_size)}
+    return {
+        "cellSize": cell_size,
+        # origin は counts[0][0] のセルの南西角。行は南から北、列は西から東
+        "origin": {"lat": round(origin[0], 6), "lng": round(origin[1], 6)},
+        "rows": dense.shape[0],
+        "cols": dense.shape[1],
+        "max": int(dense.max()) if dense.size else 0,
+        "counts": dense.tolist(),
+    }
+
 @city_router.get("/assignments")
 def get_city_assignments(user: User = Depends(city_required), db: Session = Depends(get_db)):
-    assignments = db.query(ReportAssignment).filter(ReportAssignment.assigned_by == user.id).all()
+    assignments = (
+        db.query(ReportAssignment)
+          .options(selectinload(ReportAssignment.report))
+          .filter(ReportAssignment.assigned_by == user.id)
+          .all()
+    )
+    features = {f["properties"]["id"]: f for f in serialize_reports(db, [a.report for a in assignments])}
     return [
         {
             "id": a.id,
@@ -1501,7 +2765,7 @@ def get_city_assignments(user: User = Depends(city_required), db: Session = Depe
             "status": a.status,
             "assigned_at": a.assigned_at.isoformat(),
             "completed_at": a.completed_at.isoformat() if a.completed_at else None,
-            "report": a.report.to_geojson()
+            "report": features.get(a.report_id)
         } for a in assignments
     ]
 
@@ -1561,7 +2825,7 @@ async def send_chat_message(
 
     image_url = None
     if file:
-        image_path = save_upload(file)  # save_upload を使用
+        image_path = await save_upload(file, db)
         image_url = f"/{image_path}"
 
     message = ChatMessage(
@@ -1601,20 +2865,46 @@ def get_company_linked_companies(
 
 
 # Admin Router
+@admin_router.get("/upload_metrics")
+def admin_upload_metrics(user: User = Depends(admin_required)):
+    return upload_metrics.snapshot()
+
+
 @admin_router.get("/summary")
 def admin_summary(db: Session = Depends(get_db), user: User = Depends(admin_required)):
-    total_users = db.query(User).count()
-    total_companies = db.query(Organization).count()
-    total_reports = db.query(Report).count()
-    new_reports = db.query(Report).filter(Report.status == "new").count()
+    # stat_counters から読むだけなのでデータ量に関係なく一定時間で返る
+    counters = read_counters(db, ["users", "organizations", "reports", "reports:status:new"])
     return {
-        "totalUsers": total_users,
-        "totalCompanies": total_companies,
-        "totalReports": total_reports,
-        "newReports": new_reports
+        "totalUsers": counters["users"],
+        "totalCompanies": counters["organizations"],
+        "totalReports": counters["reports"],
+        "newReports": counters["reports:status:new"]
     }
 
 
+@admin_router.get("/counters")
+def admin_counters(
+    prefix: str = Query(..., min_length=1),
+    db: Session = Depends(get_db),
+    user: User = Depends(admin_required),
+):
+    # 例: prefix=reports:org:3 → 組織 3 のレポート件数と status / category / label 別の内訳
+    rows = db.query(StatCounter.key, StatCounter.value).filter(
+        or_(StatCounter.key == prefix, StatCounter.key.startswith(f"{prefix}:", autoescape=True))
+    )
+    return dict(rows)
+
+
+@admin_router.post("/counters/reconcile")
+def admin_reconcile_counters(
+    dry_run: bool = Query(False),
+    db: Session = Depends(get_db),
+    user: User = Depends(admin_required),
+):
+    drift = reconcile_counters(db, dry_run=dry_run)
+    return {"drift": {key: {"stored": old, "actual": new} for key, (old, new) in sorted(drift.items())}}
+
+
 @app.get("/api/city/chats/{chat_id}/messages")
 def get_chat_messages(
     chat_id: int,
@@ -1719,11 +3009,12 @@ def admin_reports(db: Session = Depends(get_db), user: User = Depends(admin_requ
         .outerjoin(Organization, Report.org_id == Organization.id)
         .all()
     )
+    images = load_report_images(db, [r.id for r in rows])
     reports = []
     for r in rows:
         report_dict = dict(r._mapping)
-        images = db.query(Image).filter(Image.report_id == r.id).all()
-        report_dict["image_paths"] = [img.image_path for img in images]
+        report_dict["image_paths"] = [img.thumb_path or img.image_path for img in images.get(r.id, [])]
+        report_dict["original_image_paths"] = [img.image_path for img in images.get(r.id, [])]
         reports.append(report_dict)
     return reports
 
@@ -1738,15 +3029,71 @@ def update_report_status(report_id: int, body: dict, db: Session = Depends(get_d
     db.commit()
     return {"message": "updated"}
 
+# ユーザー一覧 (管理者・企業管理者) の並び替え。post_count / resolved_count / avg_rating はレポートの集計値
+USER_SORT_PATTERN = "^(id|name|email|post_count|resolved_count|avg_rating)$"
+USER_STAT_SORTS = ("post_count", "resolved_count", "avg_rating")
+# page だけ指定されたときの 1 ページの件数
+USER_PAGE_SIZE = 100
+
+def report_stats_by_user(db: Session, user_ids=None):
+    """user_id ごとのレポート数・解決数・平均評価 (1 回の GROUP BY)。user_ids (ID のリストか User.id のクエリ) を渡すとそのユーザーだけ集計する"""
+    query = db.query(
+        Report.user_id.label("user_id"),
+        func.count(Report.id).label("post_count"),
+        func.sum(case((Report.status == "resolved", 1), else_=0)).label("resolved_count"),
+        func.avg(Report.rating).label("avg_rating"),
+    )
+    if user_ids is not None:
+        query = query.filter(Report.user_id.in_(user_ids))
+    return query.group_by(Report.user_id)
+
+def search_users(query, search: Optional[str]):
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(or_(User.name.ilike(pattern), User.email.ilike(pattern), User.username.ilike(pattern)))
+    return query
+
+def page_users_with_stats(
+    db: Session, query, response: Response, sort: str, order: str, page: Optional[int], limit: Optional[int]
+):
+    """絞り込み済みの User クエリを並べ替えて 1 ページ分取り、[(User, 集計行 or None)] を返す。
+    page / limit がどちらも無ければ従来どおり全件を返す。総件数は X-Total-Count ヘッダーで返す (本文は従来どおりの配列)"""
+    response.headers["X-Total-Count"] = str(query.order_by(None).count())
+    # 集計は絞り込み後のユーザーの分だけ行う (全レポートの GROUP BY にしない)
+    filtered_ids = query.order_by(None).with_entities(User.id)
+    if sort in USER_STAT_SORTS:
+        # 集計値で並べるときだけ対象ユーザー分の集計を JOIN する
+        totals = report_stats_by_user(db, filtered_ids).subquery()
+        query = query.outerjoin(totals, totals.c.user_id == User.id)
+        key = totals.c.avg_rating if sort == "avg_rating" else func.coalesce(totals.c[sort], 0)
+    else:
+        key = getattr(User, sort)
+    query = query.options(selectinload(User.org)).order_by(key.desc() if order == "desc" else key.asc(), User.id)
+    paged = page is not None or limit is not None
+    if paged:
+        limit = limit or USER_PAGE_SIZE
+        query = query.offset(((page or 1) - 1) * limit).limit(limit)
+    users = query.all()
+    # 全件のときは ID を並べずに絞り込みのサブクエリで集計する
+    stats = {row.user_id: row for row in report_stats_by_user(db, [u.id for u in users] if paged else filtered_ids)} if users else {}
+    return [(u, stats.get(u.id)) for u in users]
+
 @admin_router.get("/users", response_model=List[AdminUserResponse])
-def get_admin_users(user: User = Depends(admin_required), db: Session = Depends(get_db)):
-    users = db.query(User).outerjoin(Organization).all()
+def get_admin_users(
+    response: Response,
+    search: Optional[str] = Query(None),
+    page: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    sort: str = Query("id", regex=USER_SORT_PATTERN),
+    order: str = Query("asc", regex="^(asc|desc)$"),
+    user: User = Depends(admin_required),
+    db: Session = Depends(get_db),
+):
+    query = search_users(db.query(User), search)
     result = []
-    for u in users:
-        reports = db.query(Report).filter(Report.user_id == u.id).all()
-        post_count = len(reports)
-        ratings = [r.rating for r in reports if r.rating is not None]
-        avg_rating = sum(ratings) / len(ratings) if ratings else None
+    for u, stats in page_users_with_stats(db, query, response, sort, order, page, limit):
+        post_count = stats.post_count if stats else 0
+        avg_rating = stats.avg_rating if stats else None
         org_name = u.org.name if u.org else "N/A"
         result.append({
             "id": u.id,
@@ -1767,9 +3114,44 @@ def get_admin_users(user: User = Depends(admin_required), db: Session = Depends(
     return result
 
 @admin_router.get("/logs")
-def get_admin_logs(user: User = Depends(admin_required), db: Session = Depends(get_db)):
-    logs = db.query(Log).order_by(Log.timestamp.desc()).all()
-    return [{"timestamp": l.timestamp.isoformat(), "action": l.action} for l in logs]
+def get_admin_logs(
+    cursor: Optional[int] = Query(None, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+    actor_id: Optional[int] = Query(None),
+    event: Optional[str] = Query(None),
+    target_type: Optional[str] = Query(None),
+    target_id: Optional[int] = Query(None),
+    date_from: Optional[datetime.date] = Query(None),
+    date_to: Optional[datetime.date] = Query(None),
+    search: Optional[str] = Query(None),
+    user: User = Depends(admin_required),
+    db: Session = Depends(get_db),
+):
+    # 新しい順。cursor には前のページの next_cursor (最後の行の id) を渡す
+    query = db.query(Log)
+    if actor_id is not None:
+        query = query.filter(Log.user_id == actor_id)
+    if event:
+        query = query.filter(Log.event == event)
+    if target_type:
+        query = query.filter(Log.target_type == target_type)
+    if target_id is not None:
+        query = query.filter(Log.target_id == target_id)
+    if date_from:
+        query = query.filter(Log.timestamp >= datetime.datetime.combine(date_from, datetime.time.min))
+    if date_to:
+        query = query.filter(Log.timestamp <= datetime.datetime.combine(date_to, datetime.time.max))
+    if search:
+        query = query.filter(Log.action.ilike(f"%{search}%"))
+    if cursor:
+        query = query.filter(Log.id < cursor)
+    logs = query.order_by(Log.id.desc()).limit(limit + 1).all()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
+    return {
+        "items": [serialize_log(l) for l in logs],
+        "next_cursor": logs[-1].id if has_more else None,
+    }
 
 @admin_router.post("/paypay/{user_id}")
 async def send_paypay(user_id: int, amount: int, user: User = Depends(admin_required), db: Session = Depends(get_db)):
@@ -1781,7 +3163,7 @@ async def send_paypay(user_id: int, amount: int, user: User = Depends(admin_requ
     pay_history = PayHistory(user_id=user_id, amount=amount)
     target_user.paypay_status = "sent"
     db.add(pay_history)
-    db.add(Log(action=f"PayPay {amount} sent to user {user_id} by {user.id}"))
+    audit_log(db, user, "user.paypay_sent", f"PayPay {amount} sent to user {user_id} by {user.id}", "user", user_id, amount=amount)
     db.commit()
     return {"message": "PayPay sent"}
 
@@ -1798,10 +3180,13 @@ async def update_user(
         raise HTTPException(status_code=404, detail="User not found")
     if is_blocked is not None:
         target_user.is_blocked = is_blocked
-        db.add(Log(action=f"User {user_id} {'blocked' if is_blocked else 'unblocked'} by {user.id}"))
+        audit_log(
+            db, user, "user.blocked" if is_blocked else "user.unblocked",
+            f"User {user_id} {'blocked' if is_blocked else 'unblocked'} by {user.id}", "user", user_id,
+        )
     if memo is not None:
         target_user.memo = memo
-        db.add(Log(action=f"User {user_id} memo updated by {user.id}"))
+        audit_log(db, user, "user.memo_updated", f"User {user_id} memo updated by {user.id}", "user", user_id)
     db.commit()
     return {"message": "User updated"}
 
@@ -1816,18 +3201,55 @@ async def update_company(
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     company.contract_status = contract_status
-    db.add(Log(action=f"Company {company_id} contract status set to {contract_status} by {user.id}"))
+    audit_log(
+        db, user, "organization.contract_status",
+        f"Company {company_id} contract status set to {contract_status} by {user.id}",
+        "organization", company_id, contract_status=contract_status,
+    )
     db.commit()
     return {"message": "Company updated"}
 
 @admin_router.post("/city/areas")
 def update_areas(areas: list[dict], user: User = Depends(admin_required), db: Session = Depends(get_db)):
-    db.query(Area).delete()
+    # 一括 delete だとレポートの area_id が消えたエリアを指したまま残るので、外してから 1 件ずつ消す
+    # (新しいエリアへの付け直しは rematch_report_orgs で行う)
+    detach_area_reports(db)
+    for area in db.query(Area).all():
+        db.delete(area)
     for area in areas:
         db.add(Area(name=area["name"], lat=area["lat"], lng=area["lng"]))
     db.commit()
     return {"detail": "Updated"}
 
+@admin_router.post("/areas/boundaries")
+def import_area_boundaries(
+    geojson: dict = Body(...),
+    name_property: str = Query("name"),
+    user: User = Depends(admin_required),
+    db: Session = Depends(get_db)
+):
+    # FeatureCollection の各 Feature を properties[name_property] のエリアの境界として登録する
+    features = geojson.get("features") if geojson.get("type") == "FeatureCollection" else [geojson]
+    updated = []
+    for feature in features or []:
+        name = (feature.get("properties") or {}).get(name_property)
+        if not name:
+            raise HTTPException(status_code=400, detail=f"Feature without '{name_property}' property")
+        try:
+            if not parse_polygons(feature.get("geometry")):
+                raise ValueError("empty geometry")
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid geometry for {name}: {e}")
+        area = db.query(Area).filter(Area.name == name).first()
+        if not area:
+            area = Area(name=name)
+            db.add(area)
+        area.boundary = json.dumps(feature["geometry"])
+        updated.append(name)
+    audit_log(db, user, "area.boundaries_imported", f"Area boundaries imported for {len(updated)} areas by {user.id}", areas=updated)
+    db.commit()
+    return {"updated": updated}
+
 @admin_router.get("/organizations", response_model=List[OrganizationResponse])
 async def get_organizations(user: User = Depends(admin_required), db: Session = Depends(get_db)):
     organizations = db.query(Organization).all()
@@ -1904,67 +3326,56 @@ def create_user(user: AdminCreateUser, db: Session = Depends(get_db), current_us
 @company_router.get("/reports")
 async def get_company_reports(
     page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1),
+    limit: int = Query(10, ge=1, le=500),
     category: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
     areaKeywords: Optional[str] = Query(None),  # ← 追加
+    cursor: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None, regex="^(created_at|relevance)$"),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     if user.user_type != "company":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # 1) 自社投稿
-    own = db.query(Report)\
-            .filter(Report.org_id == user.org_id, Report.label == "company")\
-            .all()
-
-    # 2) 市から共有されたもの
-    shared = db.query(Report)\
-               .join(ReportAssignment, Report.id == ReportAssignment.report_id)\
-               .filter(ReportAssignment.org_id == user.org_id)\
-               .all()
-
-    logger.debug(f"own_count={len(own)}, shared_count={len(shared)}")
-
-    # 3) マージ＆重複排除
-    reports_map = {r.id: r for r in own}
-    for r in shared:
-        reports_map[r.id] = r
-    merged = list(reports_map.values())
-
-    # 4) 絞り込み
+    # 自社投稿 + 市から共有されたもの (EXISTS) を 1 クエリで絞り込む
+    query = scope_reports_for_user(db.query(Report), user, db)
     if category:
-        merged = [r for r in merged if r.category == category]
+        query = query.filter(Report.category == category)
     if status:
-        merged = [r for r in merged if r.status == status]
+        query = query.filter(Report.status == status)
     if search:
-        merged = [
-            r for r in merged
-            if r.description and search.lower() in r.description.lower()
-        ]
+        query = apply_report_search(
+            query, search, columns=("description",), relevance=sort == "relevance" and cursor is None
+        )
     if areaKeywords:
-        kws = areaKeywords.split("|")
-        # address が NULL でないものに絞り
-        filtered = []
-        for r in merged:
-            addr = r.address or ""
-            if any(kw.lower() in addr.lower() for kw in kws):
-                filtered.append(r)
-        merged = filtered
-
-    # 5) ページング
-    total = len(merged)
-    total_pages = (total + limit - 1) // limit
-    start = (page - 1) * limit
-    page_reports = merged[start : start + limit]
+        conds = [Report.address.ilike(f"%{kw}%") for kw in areaKeywords.split("|") if kw]
+        if conds:
+            query = query.filter(or_(*conds))
+
+    # cursor 指定時は keyset pagination (件数は数えない)
+    if cursor is not None:
+        reports = apply_report_cursor(query, cursor).limit(limit + 1).all()
+        has_more = len(reports) > limit
+        reports = reports[:limit]
+        return {
+            "features": serialize_reports(db, reports),
+            "next_cursor": encode_report_cursor(reports[-1]) if has_more else None,
+        }
 
-    # 6) GeoJSON に変換して返却
-    features = [r.to_geojson() for r in page_reports]
+    total = query.count()
+    total_pages = (total + limit - 1) // limit
+    reports = (
+        apply_report_cursor(query, None)
+             .offset((page - 1) * limit)
+             .limit(limit)
+             .all()
+    )
     return {
-        "features": features,
-        "total_pages": total_pages
+        "features": serialize_reports(db, reports),
+        "total_pages": total_pages,
+        "next_cursor": encode_report_cursor(reports[-1]) if page < total_pages and reports else None,
     }
 
 @company_router.post("/integrate")
@@ -2144,7 +3555,7 @@ async def send_chat_message(
     chat = db.query(Chat).get(chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
-    logger.debug(f"Chat org_id: {chat.org_id}, User org_id: {user.org_id}")
+    logger.debug("Chat org_id: %s, User org_id: %s", chat.org_id, user.org_id)
     if chat.org_id != user.org_id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
@@ -2184,14 +3595,14 @@ async def get_chat_messages(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    logger.debug(f"🔍 [GET] /api/company/chats/{chat_id}/messages called")
-    logger.debug(f"   → current user: id={user.id}, org_id={user.org_id}")
+    logger.debug("🔍 [GET] /api/company/chats/%s/messages called", chat_id)
+    logger.debug("   → current user: id=%s, org_id=%s", user.id, user.org_id)
 
     chat = db.query(Chat).filter(Chat.id == chat_id).first()
     if not chat:
         logger.debug(f"❌ Chat not found for id={chat_id}")
         raise HTTPException(status_code=404, detail="Chat not found")
-    logger.debug(f"   → chat.org_id={chat.org_id} (type={type(chat.org_id)})")
+    logger.debug("   → chat.org_id=%s (type=%s)", chat.org_id, type(chat.org_id))
 
     # 権限チェック
     if int(chat.org_id) != int(user.org_id):
@@ -2205,7 +3616,7 @@ async def get_chat_messages(
           .order_by(ChatMessage.created_at.asc())
           .all()
     )
-    logger.debug(f"   → found {len(messages)} messages")
+    logger.debug("   → found %d messages", len(messages))
 
     return [
         {
@@ -2240,36 +3651,36 @@ async def get_messages(report_id: int, user: User = Depends(get_current_user), d
 
 @company_router.get("/users", response_model=List[UserResponse])
 def get_company_users(
+    response: Response,
     month: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
+    page: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    sort: str = Query("id", regex=USER_SORT_PATTERN),
+    order: str = Query("asc", regex="^(asc|desc)$"),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     if user.role != "admin" and not user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
-    query = db.query(User).filter(User.org_id == user.org_id)
-    if search:
-        query = query.filter(
-            (User.name.ilike(f"%{search}%")) | (User.email.ilike(f"%{search}%"))
-        )
+    query = search_users(db.query(User).filter(User.org_id == user.org_id), search)
     if month:
         try:
             start_date = datetime.datetime.strptime(month + "-01", "%Y-%m-%d")
             end_date = (start_date + datetime.timedelta(days=31)).replace(day=1)
-            query = query.join(Report).filter(
-                Report.created_at >= start_date,
-                Report.created_at < end_date
-            )
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid month format")
-    users = query.all()
+        # その月に投稿したユーザーだけ (JOIN だとレポート数だけ行が重複する)
+        query = query.filter(exists().where(
+            Report.user_id == User.id,
+            Report.created_at >= start_date,
+            Report.created_at < end_date,
+        ))
     result = []
-    for u in users:
-        reports = db.query(Report).filter(Report.user_id == u.id).all()
-        post_count = len(reports)
-        resolved_count = len([r for r in reports if r.status == "resolved"])
-        ratings = [r.rating for r in reports if r.rating is not None]
-        avg_rating = sum(ratings) / len(ratings) if ratings else None
+    for u, stats in page_users_with_stats(db, query, response, sort, order, page, limit):
+        post_count = stats.post_count if stats else 0
+        resolved_count = stats.resolved_count if stats else 0
+        avg_rating = stats.avg_rating if stats else None
         org_name = u.org.name if u.org else "N/A"
         result.append({
             "id": u.id,
@@ -2295,7 +3706,10 @@ def toggle_block(user_id: int, user: User = Depends(get_current_user), db: Sessi
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
     target_user.is_blocked = not target_user.is_blocked
-    db.add(Log(action=f"User {user_id} {'blocked' if target_user.is_blocked else 'unblocked'} by {user.id}"))
+    audit_log(
+        db, user, "user.blocked" if target_user.is_blocked else "user.unblocked",
+        f"User {user_id} {'blocked' if target_user.is_blocked else 'unblocked'} by {user.id}", "user", user_id,
+    )
     db.commit()
     return {"message": "Block status updated"}
 
@@ -2307,21 +3721,27 @@ def toggle_pay_status(user_id: int, user: User = Depends(get_current_user), db:
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
     target_user.paypay_status = "sent" if target_user.paypay_status == "unsent" else "unsent"
-    db.add(Log(action=f"User {user_id} pay status set to {target_user.paypay_status} by {user.id}"))
+    audit_log(
+        db, user, "user.pay_status",
+        f"User {user_id} pay status set to {target_user.paypay_status} by {user.id}",
+        "user", user_id, paypay_status=target_user.paypay_status,
+    )
     db.commit()
     return {"message": "Pay status updated"}
 
 @company_router.get("/assignments")
 def company_assignments(status: Optional[str] = None, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    q = db.query(ReportAssignment).filter(ReportAssignment.org_id == user.org_id)
+    q = db.query(ReportAssignment).options(selectinload(ReportAssignment.report)).filter(ReportAssignment.org_id == user.org_id)
     if status:
         q = q.filter(ReportAssignment.status == status)
+    assignments = q.all()
+    features = {f["properties"]["id"]: f for f in serialize_reports(db, [a.report for a in assignments])}
     return [
         {
             "id": a.id,
             "status": a.status,
-            "report": a.report.to_geojson()
-        } for a in q.all()
+            "report": features.get(a.report_id)
+        } for a in assignments
     ]
 
 @company_router.patch("/reports/{report_id}")
@@ -2338,6 +3758,112 @@ def update_report_status(
     db.commit()
     return {"message": "Report status updated"}
 
+def find_duplicate_report(
+    db: Session,
+    lat: float,
+    lng: float,
+    category: Optional[str],
+    created_at: Optional[datetime.datetime] = None,
+    exclude_id: Optional[int] = None,
+    radius_m: float = DUPLICATE_RADIUS_M,
+    window_days: float = DUPLICATE_WINDOW_DAYS,
+) -> Optional[Report]:
+    # category + grid_cell + created_at のインデックスで候補を絞り、距離が一番近いものを返す。
+    # exclude_id (既存レポートの判定) を渡したときは (created_at, id) で厳密に先行するものだけを候補にする。
+    # 一括取り込みは同じ created_at になるので、時刻だけで比べると後のレポートに紐付いてしまう
+    created_at = created_at or datetime.datetime.now(timezone.utc)
+    query = filter_reports_in_bbox(db.query(Report), *radius_bbox(lat, lng, radius_m)).filter(
+        Report.category == category,
+        Report.created_at >= created_at - datetime.timedelta(days=window_days),
+        Report.duplicate_of.is_(None),
+        Report.status.notin_(("resolved", "duplicate")),
+    )
+    if exclude_id is not None:
+        query = query.filter(or_(
+            Report.created_at < created_at, and_(Report.created_at == created_at, Report.id < exclude_id)
+        ))
+    else:
+        query = query.filter(Report.created_at <= created_at)
+    best = None
+    for candidate in query:
+        d = distance_m(lat, lng, candidate.lat, candidate.lng)
+        if d <= radius_m and (best is None or (d, candidate.id) < best[:2]):
+            best = (d, candidate.id, candidate)
+    return best[2] if best else None
+
+
+def mark_duplicate(report: Report, original: Report, action: str = DUPLICATE_ACTION):
+    report.duplicate_of = original.id
+    if action == "link":
+        report.status = "duplicate"
+
+
+def dedupe_reports(db: Session, batch_size: int = 500, dry_run: bool = False, action: str = DUPLICATE_ACTION) -> int:
+    # 既存レポートを古い順に見て、先行する未解決レポートの重複を紐付ける (create_report と同じ規則)
+    marked = 0
+    last = None
+    while True:
+        query = db.query(Report).filter(Report.duplicate_of.is_(None), Report.status.notin_(("resolved", "duplicate")))
+        if last is not None:
+            query = query.filter(or_(
+                Report.created_at > last[0], and_(Report.created_at == last[0], Report.id > last[1])
+            ))
+        batch = query.order_by(Report.created_at, Report.id).limit(batch_size).all()
+        if not batch:
+            break
+        last = (batch[-1].created_at, batch[-1].id)
+        for report in batch:
+            if report.duplicate_of is not None:
+                continue
+            original = find_duplicate_report(db, report.lat, report.lng, report.category, report.created_at, report.id)
+            if original is not None:
+                mark_duplicate(report, original, action)
+                marked += 1
+                # 後続の判定が今回の紐付けを見られるよう flush する (autoflush は無効)。dry_run は最後にまとめて巻き戻す
+                db.flush()
+        if not dry_run:
+            db.commit()
+    if dry_run:
+        db.rollback()
+    return marked
+
+
+def add_report(db: Session, user: User, image_paths: List[str] = (), **fields) -> Report:
+    # create_report / sync_reports 共通。ラベル判定とエリアマッチング、重複判定をして flush まで行う
+    label = classify_label(fields.get("category"))
+    area_id, matched_org_id = match_area(fields.get("address"), db, fields["lat"], fields["lng"]) or (None, None)
+    report = Report(
+        **fields,
+        org_id=matched_org_id if label == "city" and matched_org_id else user.org_id,
+        user_id=user.id,
+        label=label,
+        area_id=area_id,
+    )
+    if DUPLICATE_ACTION != "off":
+        original = find_duplicate_report(db, report.lat, report.lng, report.category, fields.get("created_at"))
+        if original is not None:
+            mark_duplicate(report, original)
+            logger.info(f"Report at ({report.lat}, {report.lng}) marked as duplicate of {original.id}")
+    db.add(report)
+    db.flush()
+    for image_path in image_paths:
+        db.add(Image(report_id=report.id, image_path=image_path))
+    return report
+
+
+def find_idempotent_response(db: Session, user: User, key: str) -> Optional[dict]:
+    row = db.query(IdempotencyKey).filter(IdempotencyKey.user_id == user.id, IdempotencyKey.key == key).first()
+    return json.loads(row.response) if row else None
+
+
+def purge_expired_idempotency_keys() -> int:
+    cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    with SessionLocal() as db:
+        purged = db.query(IdempotencyKey).filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+    return purged
+
+
 # General Endpoints
 @app.post("/reports")
 async def create_report(
@@ -2348,47 +3874,253 @@ async def create_report(
     category: str = Form(...),
     address: Optional[str] = Form(None),
     files: List[UploadFile] = File([]),
+    idempotency_key: Optional[str] = Header(None),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     if user.is_blocked:
         raise HTTPException(status_code=403, detail="User is blocked")
-    label = classify_label(category)
-    matched_area = None
-    matched_org_id = None
-    if address:
-        areas = db.query(Area).all()
-        for area in areas:
-            if area.name and area.name in address:
-                matched_area = area
-                break
-        if matched_area:
-            for org in matched_area.organizations:
-                if not org.is_company:
-                    matched_org_id = org.id
-                    break
-    org_id = matched_org_id if label == "city" and matched_org_id else user.org_id
-    report = Report(
-        lat=lat,
-        lng=lng,
-        title=title,
-        description=description,
-        category=category,
-        address=address,
-        org_id=org_id,
-        user_id=user.id,
-        label=label
+    if idempotency_key:
+        stored = find_idempotent_response(db, user, idempotency_key)
+        if stored is not None:
+            return stored
+    report = add_report(
+        db, user, await save_uploads(files, db),
+        lat=lat, lng=lng, title=title, description=description, category=category, address=address,
     )
-    db.add(report)
-    db.flush()
-    for file in files:
-        image_path = save_upload(file)
-        image = Image(report_id=report.id, image_path=image_path)
-        db.add(image)
-    db.commit()
+    if idempotency_key:
+        db.flush()
+        db.refresh(report)
+        db.add(IdempotencyKey(
+            user_id=user.id, key=idempotency_key, report_id=report.id, response=json.dumps(report.to_geojson())
+        ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # 同じキーのリクエストが先にコミットした
+        db.rollback()
+        stored = find_idempotent_response(db, user, idempotency_key) if idempotency_key else None
+        if stored is None:
+            raise
+        return stored
     db.refresh(report)
     return report.to_geojson()
 
+
+# 端末から受け取るレポートの項目 (create_report のフォームと同じ)
+SYNC_FIELDS = ("lat", "lng", "title", "description", "address", "category")
+
+@app.post("/reports/sync")
+async def sync_reports(
+    items: str = Form(...),
+    files: List[UploadFile] = File([]),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """オフラインで溜めたレポートをまとめて送る。
+
+    items は [{"key": ..., "lat": ..., "lng": ..., "category": ..., "images": [ファイル名]}, ...] の JSON。
+    受け付けるのは SYNC_FIELDS と images だけで、status / created_at などサーバー側で決める値は無視する。
+    key ごとに最初の結果を保存し、再送された key は保存済みの結果をそのまま返す (replayed=true)。
+    """
+    if user.is_blocked:
+        raise HTTPException(status_code=403, detail="User is blocked")
+    try:
+        queued = json.loads(items)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="items must be a JSON array")
+    if not isinstance(queued, list) or not all(isinstance(item, dict) for item in queued):
+        raise HTTPException(status_code=400, detail="items must be a JSON array of objects")
+    if len(queued) > SYNC_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items (max {SYNC_MAX_ITEMS})")
+
+    keys = {str(item["key"]) for item in queued if item.get("key")}
+    stored = {
+        row.key: json.loads(row.response)
+        for chunk in _id_chunks(keys)
+        for row in db.query(IdempotencyKey).filter(IdempotencyKey.user_id == user.id, IdempotencyKey.key.in_(chunk))
+    }
+    uploads = {f.filename: f for f in files}
+    budget = UploadBudget(MAX_REQUEST_UPLOAD_BYTES)
+    saved = {}
+    results = []
+    for item in queued:
+        key = str(item["key"]) if item.get("key") else None
+        if key is None:
+            results.append({"key": None, "error": "'key' is required"})
+            continue
+        if key in stored:
+            results.append({**stored[key], "replayed": True})
+            continue
+        try:
+            record = normalize_record({field: item[field] for field in (*SYNC_FIELDS, "images") if field in item})
+            missing = [name for name in record["images"] if name not in uploads]
+            if missing:
+                raise ImportRowError(f"Image not uploaded: {', '.join(missing)}")
+        except ImportRowError as e:
+            results.append({"key": key, "error": str(e)})
+            continue
+        for name in record["images"]:
+            if name not in saved:
+                saved[name] = await save_upload(uploads[name], db, budget)
+        report = add_report(
+            db, user, [saved[name] for name in record["images"]],
+            **{field: record[field] for field in SYNC_FIELDS if record.get(field) is not None},
+        )
+        result = {"key": key, "id": report.id}
+        db.add(IdempotencyKey(user_id=user.id, key=key, report_id=report.id, response=json.dumps(result)))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            result = find_idempotent_response(db, user, key)
+            if result is None:
+                # キー以外の制約違反。この項目だけ失敗として返す
+                logger.error(f"Sync item {key} failed for user {user.id}: integrity error")
+                results.append({"key": key, "error": "Database error"})
+                continue
+            # 別の接続から同じキーが先に登録された
+            results.append({**result, "replayed": True})
+            stored[key] = result
+            continue
+        stored[key] = result
+        results.append({**result, "replayed": False})
+    return {"results": results}
+
+def _store_import_images(db: Session, record: dict, archive: Optional[ImageArchive]) -> List[str]:
+    if record["images"] and archive is None:
+        raise ImportRowError("Row references images but no image archive was uploaded")
+    paths = []
+    for name in record["images"]:
+        info = archive.find(name)
+        if info.file_size > MAX_UPLOAD_BYTES:
+            raise ImportRowError(f"Image too large: {name}")
+        with archive.open(info) as src:
+            try:
+                stored = store_upload(src, UPLOAD_DIR, Path(name).suffix, MAX_UPLOAD_BYTES, claims=upload_claims)
+            except UploadTooLarge:
+                raise ImportRowError(f"Image too large: {name}")
+        hold_uploads(db, [stored.path.as_posix()])
+        upload_metrics.record(stored)
+        paths.append(stored.path.as_posix())
+    return paths
+
+
+def insert_report_batch(db: Session, user: User, batch, archive: Optional[ImageArchive] = None) -> List[dict]:
+    """正規化済みの (行番号, レコード) をまとめて INSERT し、行ごとの結果を返す。コミットは呼び出し側"""
+    now = datetime.datetime.now(timezone.utc)
+    results, mappings, image_paths = [], [], []
+    for row, record in batch:
+        try:
+            paths = _store_import_images(db, record, archive)
+        except ImportRowError as e:
+            results.append({"row": row, "error": str(e)})
+            continue
+        label = classify_label(record["category"])
+        area_id, matched_org_id = match_area(record["address"], db, record["lat"], record["lng"]) or (None, None)
+        mappings.append({
+            "lat": record["lat"],
+            "lng": record["lng"],
+            "title": record["title"],
+            "description": record["description"],
+            "category": record["category"],
+            "address": record["address"],
+            "status": record["status"] or "new",
+            "created_at": record.get("created_at") or now,
+            "label": label,
+            "org_id": matched_org_id if label == "city" and matched_org_id else user.org_id,
+            "user_id": user.id,
+            "area_id": area_id,
+            # 一括 INSERT では before_insert が走らないので _stamp_new_report と同じ値をここで入れる
+            "grid_cell": cell_of(record["lat"], record["lng"]),
+            "version": 1,
+            "updated_at": now,
+        })
+        image_paths.append(paths)
+        results.append({"row": row})
+    if not mappings:
+        return results
+    ids = db.scalars(insert(Report).returning(Report.id, sort_by_parameter_order=True), mappings).all()
+    snapshots = []
+    for report_id, mapping in zip(ids, mappings):
+        mapping["id"] = report_id
+        snapshots.append({field: mapping.get(field) for field in REPORT_SNAPSHOT_FIELDS})
+    # after_insert の代わりにスコープのバージョン・件数カウンター・コミット後の通知をまとめて行う
+    _bump_report_scopes(db.connection(), *snapshots)
+    apply_counter_deltas(db.connection(), Counter(key for m in mappings for key in report_counter_keys(m)))
+    apply_rollup_deltas(db.connection(), Counter(key for m in mappings for key in report_rollup_keys(m)))
+    db.info.setdefault("report_changes", []).extend((None, snap) for snap in snapshots)
+    db.add_all(
+        Image(report_id=report_id, image_path=path)
+        for report_id, paths in zip(ids, image_paths) for path in paths
+    )
+    inserted = iter(ids)
+    for result in results:
+        if "error" not in result:
+            result["id"] = next(inserted)
+    return results
+
+
+@app.post("/api/city/reports/import")
+def import_reports(
+    file: UploadFile = File(...),
+    images: Optional[UploadFile] = File(None),
+    format: Optional[str] = Form(None),
+    user: User = Depends(city_required),
+    db: Session = Depends(get_db),
+):
+    # NDJSON / CSV (+ 画像 zip) を IMPORT_BATCH_SIZE 行ずつ 1 トランザクションで取り込む
+    try:
+        fmt = detect_format(file.filename, file.content_type, format)
+        archive = ImageArchive(images.file, IMPORT_MAX_BYTES) if images else None
+    except ArchiveTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    started = time.perf_counter()
+    results = []
+    try:
+        valid = []
+        for row, record in iter_records(file.file, fmt):
+            try:
+                if isinstance(record, ImportRowError):
+                    raise record
+                valid.append((row, normalize_record(record)))
+            except ImportRowError as e:
+                results.append({"row": row, "error": str(e)})
+                continue
+            if len(valid) >= IMPORT_BATCH_SIZE:
+                results.extend(_commit_import_batch(db, user, valid, archive))
+                valid = []
+        if valid:
+            results.extend(_commit_import_batch(db, user, valid, archive))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8")
+    finally:
+        if archive:
+            archive.close()
+    results.sort(key=lambda r: r["row"])
+    imported = sum(1 for r in results if "id" in r)
+    elapsed = time.perf_counter() - started
+    audit_log(
+        db, user, "report.imported", f"Reports imported: {imported} of {len(results)} rows by {user.id}",
+        imported=imported, failed=len(results) - imported,
+    )
+    db.commit()
+    logger.info(f"Imported {imported}/{len(results)} reports in {elapsed:.2f}s ({len(results) / elapsed if elapsed else 0:.0f} rows/s)")
+    return {"imported": imported, "failed": len(results) - imported, "results": results}
+
+
+def _commit_import_batch(db: Session, user: User, batch, archive) -> List[dict]:
+    try:
+        results = insert_report_batch(db, user, batch, archive)
+        db.commit()
+        return results
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Report import batch failed (rows {batch[0][0]}-{batch[-1][0]}): {e}")
+        return [{"row": row, "error": "Database error"} for row, _ in batch]
+
 @city_router.get("/chats")
 def get_or_create_chat(report_id: int, user: User = Depends(city_required), db: Session = Depends(get_db)):
     report = db.query(Report).filter(Report.id == report_id).first()
@@ -2413,26 +4145,102 @@ def get_or_create_chat(report_id: int, user: User = Depends(city_required), db:
 
 @app.get("/reports", response_model=dict)
 async def get_reports(
+    request: Request,
+    response: Response,
     category: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    etag, last_modified = scope_etag(db, [f"user:{user.id}"], category, status)
+    cached = conditional_response(request, response, etag, last_modified)
+    if cached:
+        return cached
     query = db.query(Report).filter(Report.user_id == user.id)
     if category:
         query = query.filter(Report.category == category)
     if status:
         query = query.filter(Report.status == status)
     reports = query.all()
-    return {"features": [r.to_geojson() for r in reports]}
+    return {"features": serialize_reports(db, reports)}
+
+@app.get("/api/reports/bbox")
+def get_reports_in_bbox(
+    minLng: float = Query(..., ge=-180, le=180),
+    minLat: float = Query(..., ge=-90, le=90),
+    maxLng: float = Query(..., ge=-180, le=180),
+    maxLat: float = Query(..., ge=-90, le=90),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=5000),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if minLng > maxLng or minLat > maxLat:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    query = scope_reports_for_user(db.query(Report), user, db)
+    query = filter_reports_in_bbox(query, minLat, minLng, maxLat, maxLng)
+    if category:
+        query = query.filter(Report.category == category)
+    if status:
+        query = query.filter(Report.status == status)
+    reports = query.order_by(Report.created_at.desc()).limit(limit + 1).all()
+    return {
+        "features": serialize_reports(db, reports[:limit]),
+        "truncated": len(reports) > limit,
+    }
+
+@app.get("/tiles/reports/{z}/{x}/{y}.pbf")
+def get_report_tile(
+    z: int,
+    x: int,
+    y: int,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not 0 <= z <= TILE_MAX_ZOOM or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    scope = report_scope_key(user)
+    data = tile_cache.get(scope, z, x, y) if scope else None
+    cache_status = "hit"
+    if data is None:
+        cache_status = "miss"
+        # 読んでいる間にレポートが変わったら、取りこぼした結果をキャッシュしない
+        generation = tile_cache.generation
+        min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+        query = db.query(Report.id, Report.lat, Report.lng, Report.category, Report.status, Report.label)
+        query = scope_reports_for_user(query, user, db)
+        query = filter_reports_in_bbox(query, min_lat, min_lng, max_lat, max_lng)
+        features = [
+            (r.id, r.lat, r.lng, {"id": r.id, "category": r.category, "status": r.status, "label": r.label})
+            for r in query.yield_per(5000)
+        ]
+        data = encode_point_layer("reports", z, x, y, features)
+        if scope:
+            tile_cache.put(scope, z, x, y, data, generation)
+    return Response(
+        content=data,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"X-Tile-Cache": cache_status},
+    )
 
 @app.get("/reports/{report_id}", response_model=ReportResponse)
-async def get_report(report_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_report(
+    report_id: int,
+    request: Request,
+    response: Response,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     report = db.query(Report).filter(Report.id == report_id).first()
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     if report.user_id != user.id and report.org_id != user.org_id:
         raise HTTPException(status_code=403, detail="Not authorized")
+    etag = f'"report-{report.id}-v{report.version or 0}"'
+    cached = conditional_response(request, response, etag, report.updated_at or report.created_at)
+    if cached:
+        return cached
     return report
 
 
@@ -2460,8 +4268,7 @@ async def update_report(
         report.category = category
     if address is not None:
         report.address = address
-    for file in files:
-        image_path = save_upload(file)
+    for image_path in await save_uploads(files, db):
         image = Image(report_id=report.id, image_path=image_path)
         db.add(image)
     db.commit()
@@ -2610,23 +4417,59 @@ async def geocode_text(query: str = Query(...)):
         raise HTTPException(status_code=500, detail=f"Geocoding failed: {str(e)}")
 
 # Export Endpoints
-@app.get("/export/reports")
-async def export_reports(
-    category: Optional[str] = Query(None),
-    status: Optional[str] = Query(None),
-    date_from: Optional[datetime.date] = Query(None),
-    date_to: Optional[datetime.date] = Query(None),
-    search: Optional[str] = Query(None),
-    area: Optional[str] = Query(None),
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+EXPORT_COLUMNS = [
+    ("ID", Report.id),
+    ("Title", Report.title),
+    ("Description", Report.description),
+    ("Category", Report.category),
+    ("Status", Report.status),
+    ("Address", Report.address),
+    ("Created At", Report.created_at),
+    ("Rating", Report.rating),
+    ("Label", Report.label),
+    ("Latitude", Report.lat),
+    ("Longitude", Report.lng),
+    ("User ID", Report.user_id),
+    ("Organization ID", Report.org_id),
+]
+EXPORT_BATCH_SIZE = 1000
+# 形式 → (Content-Type, 拡張子)。parquet は GeoParquet、fgb は FlatGeobuf (どちらも点ジオメトリ + 属性列)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "fgb": ("application/flatgeobuf", "fgb"),
+}
+# GIS 形式の属性列 (緯度経度はジオメトリに入れる)
+GIS_EXPORT_FIELDS = [
+    (name.lower().replace(" ", "_"), {int: "int", float: "float", datetime.datetime: "datetime"}.get(column.type.python_type, "str"))
+    for name, column in EXPORT_COLUMNS
+    if column.key not in ("lat", "lng")
+]
+
+
+def export_scope(user: User) -> dict:
+    # ストリーミング中は別セッションで読むので、User ではなく絞り込みに使う値だけを渡す
+    return {"user_type": user.user_type, "user_id": user.id, "org_id": user.org_id}
+
+
+def report_export_query(
+    db: Session,
+    scope: dict,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    search: Optional[str] = None,
+    area: Optional[str] = None,
+    sort: Optional[str] = None,
 ):
-    if user.user_type == "city":
-        query = db.query(Report).filter(Report.label == "city")
-        if user.org_id:
-            query = query.filter(Report.org_id == user.org_id)
+    query = db.query(*[column for _, column in EXPORT_COLUMNS])
+    if scope["user_type"] == "city":
+        query = query.filter(Report.label == "city")
+        if scope["org_id"]:
+            query = query.filter(Report.org_id == scope["org_id"])
     else:
-        query = db.query(Report).filter(Report.user_id == user.id)
+        query = query.filter(Report.user_id == scope["user_id"])
     if category:
         query = query.filter(Report.category == category)
     if status:
@@ -2638,39 +4481,263 @@ async def export_reports(
     if area:
         query = query.filter(Report.address.ilike(f"%{area}%"))
     if search:
-        query = query.filter(or_(
-            Report.title.ilike(f"%{search}%"),
-            Report.description.ilike(f"%{search}%"),
-            Report.address.ilike(f"%{search}%"),
-        ))
-    reports = query.order_by(Report.created_at.desc()).all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "ID", "Title", "Description", "Category", "Status", "Address",
-        "Created At", "Rating", "Label", "Latitude", "Longitude", "User ID", "Organization ID"
-    ])
-    for report in reports:
+        query = apply_report_search(query, search, relevance=sort == "relevance")
+    return query.order_by(Report.created_at.desc())
+
+
+def iter_export_rows(scope: dict, filters: dict, batch_size: int = EXPORT_BATCH_SIZE):
+    # yield_per でサーバー側カーソル (postgres) / 逐次 fetch (sqlite) を使い、batch_size 行ずつしか保持しない
+    with SessionLocal() as db:
+        yield from report_export_query(db, scope, **filters).yield_per(batch_size)
+
+
+def iter_gis_rows(scope: dict, filters: dict, batch_size: int = EXPORT_BATCH_SIZE, on_batch=None):
+    # (lng, lat, GIS_EXPORT_FIELDS の値...) を返す
+    keys = [column.key for _, column in EXPORT_COLUMNS]
+    positions = [i for i, key in enumerate(keys) if key not in ("lat", "lng")]
+    lat_at, lng_at = keys.index("lat"), keys.index("lng")
+    n = 0
+    for n, row in enumerate(iter_export_rows(scope, filters, batch_size), start=1):
+        yield (row[lng_at], row[lat_at], *[row[i] for i in positions])
+        if on_batch and n % batch_size == 0:
+            on_batch(n)
+    if on_batch:
+        on_batch(n)
+
+
+def iter_export(fmt: str, scope: dict, filters: dict, on_batch=None):
+    """形式ごとのバイト列ジェネレーター。どの形式も EXPORT_BATCH_SIZE 行ずつ読み、書いた分から返す"""
+    if fmt == "csv":
+        return (chunk.encode("utf-8") for chunk in iter_report_csv(scope, filters, on_batch=on_batch))
+    if fmt == "parquet":
+        return iter_geoparquet(iter_gis_rows(scope, filters, on_batch=on_batch), GIS_EXPORT_FIELDS, EXPORT_BATCH_SIZE)
+    if fmt == "fgb":
+        return iter_flatgeobuf(iter_gis_rows(scope, filters, on_batch=on_batch), GIS_EXPORT_FIELDS, "reports", EXPORT_BATCH_SIZE)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def check_export_format(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    if fmt == "parquet" and not geoparquet_available():
+        raise HTTPException(status_code=501, detail="GeoParquet export requires pyarrow")
+
+
+def iter_report_csv(scope: dict, filters: dict, batch_size: int = EXPORT_BATCH_SIZE, on_batch=None):
+    # on_batch(書き出した行数の累計) はバッチごとに呼ばれる (エクスポートジョブの進捗用)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    n = 0
+    for n, row in enumerate(iter_export_rows(scope, filters, batch_size), start=1):
         writer.writerow([
-            report.id,
-            report.title,
-            report.description,
-            report.category,
-            report.status,
-            report.address,
-            report.created_at.isoformat() if report.created_at else "",
-            report.rating,
-            report.label,
-            report.lat,
-            report.lng,
-            report.user_id,
-            report.org_id,
+            value.isoformat() if isinstance(value, datetime.datetime) else value
+            for value in row
         ])
-    output.seek(0)
+        if n % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if on_batch:
+                on_batch(n)
+    if buffer.tell():
+        yield buffer.getvalue()
+    if on_batch:
+        on_batch(n)
+
+
+@app.get("/export/reports")
+def export_reports(
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    date_from: Optional[datetime.date] = Query(None),
+    date_to: Optional[datetime.date] = Query(None),
+    search: Optional[str] = Query(None),
+    area: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None, regex="^(created_at|relevance)$"),
+    format: str = Query("csv"),
+    user: User = Depends(get_current_user),
+):
+    check_export_format(format)
+    filters = {
+        "category": category, "status": status, "date_from": date_from, "date_to": date_to,
+        "search": search, "area": area, "sort": sort,
+    }
+    media_type, ext = EXPORT_FORMATS[format]
+    # 先頭 (CSV ヘッダー / ファイルヘッダー) をすぐ返し、以降は EXPORT_BATCH_SIZE 行ごとに送る (同期ジェネレーターなのでスレッドプールで回る)
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment;filename=reports.csv"}
+        iter_export(format, export_scope(user), filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment;filename=reports.{ext}"}
+    )
+
+
+# 非同期エクスポートジョブ: 投入 → 進捗確認 → ダウンロード (Range 対応)。ファイルは EXPORT_TTL_HOURS で期限切れ
+EXPORT_DIR = BASE_DIR / "cache" / "exports"
+export_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+# 実行中ジョブの書き出し済み行数。読み出し中の DB に書き込まないようメモリで持ち、完了時に rows_written へ反映する
+export_progress: Dict[str, int] = {}
+
+
+def export_job_path(job: ExportJob) -> Path:
+    return EXPORT_DIR / f"{job.id}.{EXPORT_FORMATS[job.format][1]}"
+
+
+def write_export_file(fmt: str, scope: dict, filters: dict, path: Path, on_batch):
+    with open(path, "wb") as f:
+        for chunk in iter_export(fmt, scope, filters, on_batch):
+            f.write(chunk)
+
+
+def run_export_job(job_id: str):
+    with SessionLocal() as db:
+        job = db.get(ExportJob, job_id)
+        if job is None or job.status != "queued":
+            return
+
+        def progress(rows):
+            export_progress[job_id] = rows
+
+        path = export_job_path(job)
+        tmp = path.with_name(path.name + ".part")
+        # 件数の集計で失敗しても running のまま残らないよう、ここから先はすべて failed の扱いにする
+        try:
+            scope, filters = json.loads(job.filters)
+            for key in ("date_from", "date_to"):
+                if filters.get(key):
+                    filters[key] = datetime.date.fromisoformat(filters[key])
+            job.status = "running"
+            job.total_rows = report_export_query(db, scope, **filters).order_by(None).count()
+            db.commit()
+            export_progress[job_id] = 0
+            EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+            write_export_file(job.format, scope, filters, tmp, progress)
+            os.replace(tmp, path)
+        except Exception as e:
+            db.rollback()
+            tmp.unlink(missing_ok=True)
+            logger.error(f"Export job {job_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "done"
+            job.file_size = path.stat().st_size
+        now = datetime.datetime.now(timezone.utc)
+        job.rows_written = export_progress.pop(job_id, 0)
+        job.finished_at = now
+        job.expires_at = now + datetime.timedelta(hours=EXPORT_TTL_HOURS)
+        db.commit()
+
+
+def purge_expired_exports() -> int:
+    now = datetime.datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        expired = db.query(ExportJob).filter(ExportJob.expires_at < now).all()
+        for job in expired:
+            if job.format in EXPORT_FORMATS:
+                export_job_path(job).unlink(missing_ok=True)
+            db.delete(job)
+        db.commit()
+    return len(expired)
+
+
+def export_job_status(job: ExportJob) -> dict:
+    rows = export_progress.get(job.id, job.rows_written or 0)
+    return {
+        "id": job.id,
+        "format": job.format,
+        "status": job.status,
+        "totalRows": job.total_rows,
+        "rowsWritten": rows,
+        "progress": round(min(rows / job.total_rows, 1.0), 4) if job.total_rows else (1.0 if job.status == "done" else 0.0),
+        "fileSize": job.file_size,
+        "error": job.error,
+        "createdAt": job.created_at.isoformat() if job.created_at else None,
+        "expiresAt": job.expires_at.isoformat() if job.expires_at else None,
+        "downloadUrl": f"/export/jobs/{job.id}/download" if job.status == "done" else None,
+    }
+
+
+def get_export_job(db: Session, job_id: str, user: User) -> ExportJob:
+    job = db.get(ExportJob, job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+
+@app.post("/export/jobs", status_code=202)
+def submit_export_job(
+    format: str = Query("csv"),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    date_from: Optional[datetime.date] = Query(None),
+    date_to: Optional[datetime.date] = Query(None),
+    search: Optional[str] = Query(None),
+    area: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None, regex="^(created_at|relevance)$"),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    check_export_format(format)
+    purge_expired_exports()
+    filters = {
+        "category": category, "status": status,
+        "date_from": date_from.isoformat() if date_from else None,
+        "date_to": date_to.isoformat() if date_to else None,
+        "search": search, "area": area, "sort": sort,
+    }
+    job = ExportJob(
+        id=uuid.uuid4().hex, user_id=user.id, format=format, filters=json.dumps([export_scope(user), filters])
+    )
+    db.add(job)
+    db.commit()
+    export_executor.submit(run_export_job, job.id)
+    return export_job_status(job)
+
+
+@app.get("/export/jobs/{job_id}")
+def get_export_job_status(job_id: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return export_job_status(get_export_job(db, job_id, user))
+
+
+@app.get("/export/jobs/{job_id}/download")
+def download_export_job(
+    job_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    job = get_export_job(db, job_id, user)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    path = export_job_path(job)
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Export file has expired")
+    size = path.stat().st_size
+    media_type, ext = EXPORT_FORMATS[job.format]
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment;filename=reports.{ext}",
+        "ETag": f'"{job.id}-{size}"',
+    }
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return StreamingResponse(
+            iter_file_range(path, 0, size - 1), media_type=media_type,
+            headers={**headers, "Content-Length": str(size)},
+        )
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)},
     )
 
 # WebSocket for chats
@@ -2687,7 +4754,7 @@ async def chat_websocket(chat_id: int, websocket: WebSocket, db: Session = Depen
     try:
         payload = jwt.decode(token, SECRET, algorithms=[ALGORITHM])
         user_id = int(payload.get("sub"))
-        logger.debug(f"✅ JWT解析成功: user_id={user_id}")
+        logger.debug("✅ JWT解析成功: user_id=%s", user_id)
     except JWTError as e:
         logger.error(f"❌ JWT解析エラー: {e}")
         if websocket.client_state != WebSocketState.DISCONNECTED:
@@ -2717,7 +4784,7 @@ async def chat_websocket(chat_id: int, websocket: WebSocket, db: Session = Depen
     try:
         while True:
             text = await websocket.receive_text()
-            logger.debug(f"📩 受信メッセージ: {text}")
+            logger.debug("📩 受信メッセージ: %s", text)
             msg = ChatMessage(chat_id=chat.id, user_id=user.id, text=text)
             db.add(msg)
             db.commit()
@@ -2764,9 +4831,129 @@ def dump_routes():
             logger.debug(f"[Other:{type(r)}] path={getattr(r, 'path', None)}")
     logger.debug("===== End Routes =====")
 
+@app.on_event("startup")
+def backfill_upload_refs():
+    # 参照数の管理を始める前のアップロードを数えておく (upload_blobs が空のときだけ)
+    with SessionLocal() as db:
+        if db.query(UploadBlob).first() is not None:
+            return
+        counts = defaultdict(int)
+        for (url,) in db.query(Image.image_path).union_all(
+            db.query(ChatMessage.image).filter(ChatMessage.image.isnot(None))
+        ):
+            key = upload_key(url)
+            if key:
+                counts[key] += 1
+        now = datetime.datetime.now(timezone.utc)
+        db.bulk_insert_mappings(UploadBlob, [
+            {"path": key, "refcount": n, "updated_at": now} for key, n in counts.items()
+        ])
+        db.commit()
+        if counts:
+            logger.info(f"Backfilled reference counts for {len(counts)} uploads")
+
+@app.on_event("startup")
+def initialize_counters():
+    # stat_counters が空 (導入直後) なら実テーブルから作る
+    with SessionLocal() as db:
+        if db.query(StatCounter).first() is None:
+            drift = reconcile_counters(db)
+            logger.info(f"Initialized {len(drift)} stat counters")
+
+@app.on_event("startup")
+def initialize_report_rollups():
+    with SessionLocal() as db:
+        # rollup_key 列の追加前に作った行が残っていれば、一意キー付きで作り直す
+        legacy = db.query(ReportRollup.id).filter(ReportRollup.rollup_key.is_(None)).first() is not None
+        if legacy or (db.query(ReportRollup.id).first() is None and db.query(Report.id).first() is not None):
+            logger.info(f"Built {rebuild_report_rollups(db)} report rollup rows")
+
+@app.on_event("startup")
+def backfill_report_cells():
+    # grid_cell 列追加前のレポートにセル番号を振る
+    with SessionLocal() as db:
+        rows = db.query(Report.id, Report.lat, Report.lng).filter(Report.grid_cell.is_(None)).all()
+        for start in range(0, len(rows), 1000):
+            db.bulk_update_mappings(Report, [
+                {"id": r.id, "grid_cell": cell_of(r.lat, r.lng)} for r in rows[start:start + 1000]
+            ])
+        db.commit()
+        if rows:
+            logger.info(f"Backfilled grid_cell for {len(rows)} reports")
+
+@app.on_event("shutdown")
+def stop_thumbnail_worker():
+    thumbnail_worker.shutdown(wait=False)
+
+@app.on_event("startup")
+def recover_export_jobs():
+    # 再起動で中断されたジョブは失敗扱いにする
+    with SessionLocal() as db:
+        now = datetime.datetime.now(timezone.utc)
+        db.query(ExportJob).filter(ExportJob.status.in_(("queued", "running"))).update(
+            {"status": "failed", "error": "Interrupted by server restart", "finished_at": now,
+             "expires_at": now + datetime.timedelta(hours=EXPORT_TTL_HOURS)},
+            synchronize_session=False,
+        )
+        db.commit()
+
+@app.on_event("startup")
+async def start_export_cleanup():
+    async def purge_loop():
+        while True:
+            try:
+                purged = await run_in_threadpool(purge_expired_exports)
+                if purged:
+                    logger.info(f"Purged {purged} expired export files")
+            except Exception as e:
+                logger.error(f"Export cleanup failed: {e}")
+            await asyncio.sleep(3600)
+    asyncio.get_running_loop().create_task(purge_loop())
+
+@app.on_event("startup")
+async def start_idempotency_cleanup():
+    async def purge_loop():
+        while True:
+            try:
+                purged = await run_in_threadpool(purge_expired_idempotency_keys)
+                if purged:
+                    logger.info(f"Purged {purged} expired idempotency keys")
+            except Exception as e:
+                logger.error(f"Idempotency key cleanup failed: {e}")
+            await asyncio.sleep(3600)
+    asyncio.get_running_loop().create_task(purge_loop())
+
+@app.on_event("startup")
+async def start_log_archiver():
+    async def archive_loop():
+        while True:
+            try:
+                moved = await run_in_threadpool(archive_logs)
+                if moved:
+                    logger.info(f"Archived {moved} audit log entries to {LOG_ARCHIVE_DIR}")
+            except Exception as e:
+                logger.error(f"Audit log archiving failed: {e}")
+            await asyncio.sleep(24 * 3600)
+    asyncio.get_running_loop().create_task(archive_loop())
+
+@app.on_event("startup")
+async def start_upload_sweeper():
+    async def sweep_loop():
+        while True:
+            # 起動直後は書き込み中のリクエストが無いとは限らないので、1 周期待ってから消す
+            await asyncio.sleep(UPLOAD_SWEEP_INTERVAL)
+            try:
+                removed = await run_in_threadpool(sweep_orphan_uploads)
+                if removed:
+                    logger.info(f"Removed {removed} orphan upload files")
+            except Exception as e:
+                logger.error(f"Upload sweep failed: {e}")
+    asyncio.get_running_loop().create_task(sweep_loop())
+
 # Include Routers
 
 # Main entry point
 if __name__ == "__main__":
     logger.info("Starting Uvicorn server")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # ログ設定は setup_logging 済みなので uvicorn には触らせない
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
\ No newline at end of file
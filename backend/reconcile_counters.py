@@ -0,0 +1,25 @@
+import argparse
+
+from main import SessionLocal, rebuild_report_rollups, reconcile_counters
+
+# stat_counters を実テーブルの件数と突き合わせて直す
+#   python reconcile_counters.py --dry-run   # ずれているキーだけ表示
+#   python reconcile_counters.py             # 実際に直す
+#   python reconcile_counters.py --rollups   # 時系列集計 (report_rollups) も作り直す
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="件数カウンターを実数に合わせる")
+    parser.add_argument("--dry-run", action="store_true", help="更新せずにずれだけ表示する")
+    parser.add_argument("--rollups", action="store_true", help="時系列集計も reports から作り直す")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        drift = reconcile_counters(db, dry_run=args.dry_run)
+    for key, (stored, actual) in sorted(drift.items()):
+        print(f"{key}: {stored} -> {actual}")
+    label = "修正予定" if args.dry_run else "修正"
+    print(f"{label}: {len(drift)} 件")
+
+    if args.rollups and not args.dry_run:
+        with SessionLocal() as db:
+            print(f"時系列集計: {rebuild_report_rollups(db)} 行")
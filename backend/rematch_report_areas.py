@@ -0,0 +1,18 @@
+import argparse
+
+from main import SessionLocal, rematch_report_orgs
+
+# 既存レポートの area_id と (市ラベルの) org_id を現在のエリア設定で振り分け直す
+#   python rematch_report_areas.py --dry-run   # 変更件数だけ表示
+#   python rematch_report_areas.py             # 実際に更新
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="レポートをエリアで再マッチングする")
+    parser.add_argument("--dry-run", action="store_true", help="更新せずに件数だけ表示する")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        changed = rematch_report_orgs(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    label = "変更予定" if args.dry_run else "更新"
+    print(f"{label}: {changed} 件")
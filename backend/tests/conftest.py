@@ -0,0 +1,23 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# utils/ のテストは main を読み込まずに直接 import する
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    # main は import 時に DB を作るので、環境変数で一時 DB を指してから読み込む
+    db_path = tmp_path_factory.mktemp("db") / "walkaudit.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["LOG_FILE"] = ""
+    os.environ["LOG_STDERR"] = "0"
+    os.chdir(BACKEND_DIR)
+    module = importlib.import_module("main")
+    yield module
+    module.thumbnail_worker.shutdown()
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from utils.area_polygons import NODE_CAPACITY, AreaIndex, parse_polygons
+from utils.area_utils import AreaMatcher
+
+
+# --- 住所の文字列一致 (Aho-Corasick) ------------------------------------------
+
+def test_matcher_returns_smallest_area_id():
+    matcher = AreaMatcher([(3, "中央区", 30), (1, "銀座", 10), (2, "東京都", 20)])
+    assert matcher.match("東京都中央区銀座1丁目") == (1, 10)
+    assert matcher.match("東京都中央区日本橋") == (2, 20)
+
+
+def test_matcher_follows_failure_links():
+    # "abd" の途中で外れても "bc" を見落とさない / 長い名前に含まれる短い名前も拾う
+    matcher = AreaMatcher([(2, "abd", None), (1, "bc", 7)])
+    assert matcher.match("xabcx") == (1, 7)
+    matcher = AreaMatcher([(5, "港区芝", None), (4, "区芝", 40)])
+    assert matcher.match("東京都港区芝公園") == (4, 40)
+
+
+def test_matcher_without_match():
+    matcher = AreaMatcher([(1, "銀座", None), (2, "", None)])
+    assert matcher.match("大阪市北区") is None
+    assert matcher.match("") is None
+    assert matcher.match(None) is None
+
+
+def test_matcher_agrees_with_substring_search():
+    areas = [(i, name, i * 10) for i, name in enumerate(["北", "北区", "区北", "北区北", "南北", "中央"], start=1)]
+    matcher = AreaMatcher(areas)
+    for address in ["東京都北区", "区北町", "南北線", "中央区北", "西区", "北区北区"]:
+        found = [area_id for area_id, name, _ in areas if name in address]
+        expected = (min(found), min(found) * 10) if found else None
+        assert matcher.match(address) == expected, address
+
+
+# --- 境界ポリゴンの点検索 (R-tree) ---------------------------------------------
+
+def square(x0, y0, size, hole=None):
+    ring = [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+    rings = [ring]
+    if hole:
+        hx, hy, hs = hole
+        rings.append([[hx, hy], [hx + hs, hy], [hx + hs, hy + hs], [hx, hy + hs], [hx, hy]])
+    return {"type": "Polygon", "coordinates": rings}
+
+
+def test_parse_polygons():
+    multi = {"type": "MultiPolygon", "coordinates": [square(0, 0, 1)["coordinates"], square(5, 5, 1)["coordinates"]]}
+    assert len(parse_polygons(multi)) == 2
+    assert parse_polygons(json.dumps({"type": "Feature", "geometry": square(0, 0, 1)}))[0][0][1] == (1.0, 0.0)
+    assert parse_polygons(None) == []
+    with pytest.raises(ValueError):
+        parse_polygons({"type": "Point", "coordinates": [0, 0]})
+
+
+def test_index_prefers_smallest_containing_area():
+    index = AreaIndex([(1, 10, json.dumps(square(0, 0, 10))), (2, 20, json.dumps(square(2, 2, 2)))])
+    assert index.locate(3, 3) == (2, 20)  # (lat, lng)
+    assert index.locate(8, 8) == (1, 10)
+    assert index.locate(11, 5) is None
+
+
+def test_index_excludes_holes():
+    index = AreaIndex([(1, None, json.dumps(square(0, 0, 10, hole=(4, 4, 2))))])
+    assert index.locate(5, 5) is None
+    assert index.locate(1, 1) == (1, None)
+
+
+def test_index_with_many_areas_matches_linear_scan():
+    # NODE_CAPACITY を超える数で、複数段のノードができるようにする
+    areas = [(y * 20 + x + 1, None, json.dumps(square(x, y, 1))) for y in range(20) for x in range(20)]
+    assert len(areas) > NODE_CAPACITY ** 2
+    index = AreaIndex(areas)
+    for lat, lng in [(0.5, 0.5), (19.5, 19.5), (7.25, 13.75), (12.9, 0.1)]:
+        assert index.locate(lat, lng) == (int(lat) * 20 + int(lng) + 1, None)
+    assert index.locate(-0.5, 5) is None
+    assert index.locate(5, 20.5) is None
+
+
+def test_empty_index():
+    index = AreaIndex([])
+    assert not index
+    assert index.locate(0, 0) is None
@@ -0,0 +1,58 @@
+import datetime
+
+import pytest
+
+# 重複レポートの紐付けは (created_at, id) で先行するレポートへ向かうこと
+CATEGORY = "dedupe-test"
+
+
+@pytest.fixture
+def db(main):
+    session = main.SessionLocal()
+    yield session
+    session.query(main.Report).filter(main.Report.category == CATEGORY).delete()
+    session.commit()
+    session.close()
+
+
+def add_reports(main, db, created_at, n, lat=10.0, lng=20.0):
+    user = db.query(main.User).filter(main.User.email == "dedupe@test").first()
+    if user is None:
+        user = main.User(email="dedupe@test", password="x", code="DEDUPE-T")
+        db.add(user)
+        db.flush()
+    reports = [
+        main.Report(lat=lat, lng=lng + i * 0.00001, category=CATEGORY, status="new", user_id=user.id, created_at=created_at)
+        for i in range(n)
+    ]
+    db.add_all(reports)
+    db.commit()
+    return [r.id for r in reports]
+
+
+def links(main, db, ids):
+    db.expire_all()
+    return [(r.id, r.duplicate_of, r.status) for r in db.query(main.Report).filter(main.Report.id.in_(ids)).order_by(main.Report.id)]
+
+
+def test_same_timestamp_links_to_lowest_id(main, db):
+    # 一括取り込みと同じく全件が同じ created_at
+    ids = add_reports(main, db, datetime.datetime(2026, 1, 1, 9, 0), 3)
+    main.dedupe_reports(db, action="link")
+    first = ids[0]
+    assert links(main, db, ids) == [(first, None, "new"), (ids[1], first, "duplicate"), (ids[2], first, "duplicate")]
+
+
+def test_links_point_to_earlier_report(main, db):
+    base = datetime.datetime(2026, 1, 1, 9, 0)
+    later = add_reports(main, db, base + datetime.timedelta(hours=1), 1)
+    earlier = add_reports(main, db, base, 1)
+    main.dedupe_reports(db, action="link")
+    assert links(main, db, earlier + later) == [(later[0], earlier[0], "duplicate"), (earlier[0], None, "new")]
+
+
+def test_candidates_exclude_later_reports(main, db):
+    ids = add_reports(main, db, datetime.datetime(2026, 1, 1, 9, 0), 2)
+    first, second = (db.get(main.Report, i) for i in ids)
+    assert main.find_duplicate_report(db, first.lat, first.lng, CATEGORY, first.created_at, first.id) is None
+    assert main.find_duplicate_report(db, second.lat, second.lng, CATEGORY, second.created_at, second.id).id == first.id
@@ -0,0 +1,65 @@
+import pytest
+
+from utils.file_range import RangeNotSatisfiable, iter_file_range, parse_byte_range
+
+SIZE = 10
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=0-0", (0, 0)),
+    ("bytes=2-5", (2, 5)),
+    ("bytes=5-", (5, 9)),
+    ("bytes=-5", (5, 9)),
+    ("bytes=-20", (0, 9)),  # 末尾 N バイトがファイルより長ければ全体
+    ("bytes=3-100", (3, 9)),  # 終端はファイル末尾に切り詰める
+    (" bytes=1-2", None),
+    ("bytes= 1 - 2 ", (1, 2)),
+])
+def test_parse_satisfiable(header, expected):
+    assert parse_byte_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "items=0-5",
+    "bytes=0-1,4-5",  # 複数範囲は全体を返す
+    "bytes=5",
+    "bytes=-",
+    "bytes=x-",
+    "bytes=1-y",
+])
+def test_parse_ignored(header):
+    assert parse_byte_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=-0",
+    "bytes=10-",
+    "bytes=20-",
+    "bytes=5-2",
+])
+def test_parse_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range(header, SIZE)
+
+
+def test_empty_file_is_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range("bytes=0-", 0)
+
+
+def test_iter_file_range(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(bytes(range(100)))
+    chunks = list(iter_file_range(path, 10, 29, chunk_size=7))
+    assert [len(c) for c in chunks] == [7, 7, 6]
+    assert b"".join(chunks) == bytes(range(10, 30))
+
+
+def test_iter_file_range_stops_at_eof(tmp_path):
+    # 読み出し中にファイルが短くなっても止まる
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"abc")
+    assert b"".join(iter_file_range(path, 1, 10)) == b"bc"
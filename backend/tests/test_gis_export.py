@@ -0,0 +1,126 @@
+import datetime
+import struct
+
+from utils.gis_export import FGB_COLUMN_TYPES, FGB_MAGIC, FGB_POINT, iter_flatgeobuf
+
+# FlatGeobuf の出力を FlatBuffers の規則 (vtable / uoffset) で読み戻して確かめる
+FIELDS = [("id", "int"), ("rating", "float"), ("category", "str"), ("created_at", "datetime")]
+
+
+class Table:
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+        vtable = pos - struct.unpack_from("<i", buf, pos)[0]
+        vtable_size, self.inline_size = struct.unpack_from("<HH", buf, vtable)
+        self.slots = struct.unpack_from(f"<{(vtable_size - 4) // 2}H", buf, vtable + 4)
+
+    def _offset(self, slot):
+        return self.slots[slot] if slot < len(self.slots) else 0
+
+    def scalar(self, slot, fmt, default=0):
+        offset = self._offset(slot)
+        return struct.unpack_from(fmt, self.buf, self.pos + offset)[0] if offset else default
+
+    def _target(self, slot):
+        offset = self._offset(slot)
+        if not offset:
+            return None
+        at = self.pos + offset
+        return at + struct.unpack_from("<I", self.buf, at)[0]
+
+    def string(self, slot):
+        at = self._target(slot)
+        if at is None:
+            return None
+        size = struct.unpack_from("<I", self.buf, at)[0]
+        assert self.buf[at + 4 + size] == 0
+        return self.buf[at + 4:at + 4 + size].decode("utf-8")
+
+    def table(self, slot):
+        at = self._target(slot)
+        return Table(self.buf, at) if at is not None else None
+
+    def tables(self, slot):
+        at = self._target(slot)
+        count = struct.unpack_from("<I", self.buf, at)[0]
+        return [Table(self.buf, at + 4 + 4 * i + struct.unpack_from("<I", self.buf, at + 4 + 4 * i)[0]) for i in range(count)]
+
+    def vector(self, slot, fmt):
+        at = self._target(slot)
+        count = struct.unpack_from("<I", self.buf, at)[0]
+        # 要素は要素サイズ境界に揃っていること
+        assert (at + 4) % struct.calcsize(fmt) == 0
+        return list(struct.unpack_from(f"<{count}{fmt[-1]}", self.buf, at + 4))
+
+
+def root(buf):
+    return Table(buf, struct.unpack_from("<I", buf, 0)[0])
+
+
+def split_fgb(data):
+    """(ヘッダー, [フィーチャー]) のバッファ (どれも長さの接頭辞を除いたもの)"""
+    assert data[:8] == FGB_MAGIC
+    pos = 8
+    parts = []
+    while pos < len(data):
+        size = struct.unpack_from("<I", data, pos)[0]
+        parts.append(data[pos + 4:pos + 4 + size])
+        pos += 4 + size
+    assert pos == len(data)
+    return parts[0], parts[1:]
+
+
+def read_properties(raw):
+    values, pos = {}, 0
+    while pos < len(raw):
+        index = struct.unpack_from("<H", raw, pos)[0]
+        pos += 2
+        name, kind = FIELDS[index]
+        if kind == "int":
+            values[name] = struct.unpack_from("<q", raw, pos)[0]
+            pos += 8
+        elif kind == "float":
+            values[name] = struct.unpack_from("<d", raw, pos)[0]
+            pos += 8
+        else:
+            size = struct.unpack_from("<I", raw, pos)[0]
+            values[name] = raw[pos + 4:pos + 4 + size].decode("utf-8")
+            pos += 4 + size
+    return values
+
+
+def test_header():
+    header, features = split_fgb(b"".join(iter_flatgeobuf([], FIELDS, name="reports")))
+    assert features == []
+    table = root(header)
+    assert table.string(0) == "reports"
+    assert table.scalar(2, "<B") == FGB_POINT
+    assert table.scalar(8, "<Q") == 0  # 件数は書かない
+    # インデックスなし: 0 を明示する (既定値 16 だと読み手が R-tree を探す)
+    assert table.slots[9] != 0 and table.scalar(9, "<H") == 0
+    columns = [(c.string(0), c.scalar(1, "<B")) for c in table.tables(7)]
+    assert columns == [(name, FGB_COLUMN_TYPES[kind]) for name, kind in FIELDS]
+    crs = table.table(10)
+    assert (crs.string(0), crs.scalar(1, "<i")) == ("EPSG", 4326)
+
+
+def test_features_round_trip():
+    created = datetime.datetime(2026, 1, 2, 3, 4, 5)
+    rows = [
+        (139.7671, 35.6812, 1, 4.5, "road", created),
+        (-0.1276, 51.5072, 2, None, "公園", None),
+    ]
+    _, features = split_fgb(b"".join(iter_flatgeobuf(rows, FIELDS, batch_size=1)))
+    assert len(features) == 2
+    decoded = []
+    for raw in features:
+        feature = root(raw)
+        geometry = feature.table(0)
+        decoded.append((geometry.vector(1, "<d"), read_properties(bytes(feature.vector(1, "<B")))))
+    assert decoded[0] == ([139.7671, 35.6812], {
+        "id": 1, "rating": 4.5, "category": "road", "created_at": "2026-01-02T03:04:05+00:00",
+    })
+    # None の属性は書かない
+    assert decoded[1] == ([-0.1276, 51.5072], {"id": 2, "category": "公園"})
+
@@ -0,0 +1,170 @@
+import struct
+
+import pytest
+
+from utils.cluster_index import mercator
+from utils.mvt import TILE_EXTENT, encode_point_layer, tile_bounds, tile_of
+
+# エンコードしたタイルを protobuf のワイヤ形式のまま読み戻し、仕様 (MVT v2) どおりの中身か確かめる
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_fields(data):
+    """[(field, wire_type, 値)]。長さ付きは bytes、varint は int、64 bit は bytes で返す"""
+    fields, pos = [], 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            size, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + size], pos + size
+        else:
+            raise AssertionError(f"unexpected wire type {wire_type}")
+        fields.append((field, wire_type, value))
+    return fields
+
+
+def packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    (field, _, value), = read_fields(data)
+    if field == 1:
+        return value.decode("utf-8")
+    if field == 3:
+        return struct.unpack("<d", value)[0]
+    if field == 6:
+        return unzigzag(value)
+    if field == 7:
+        return bool(value)
+    raise AssertionError(f"unexpected value field {field}")
+
+
+def decode_tile(data):
+    layers = {}
+    for field, _, layer_bytes in read_fields(data):
+        assert field == 3
+        layer = {"features": [], "keys": [], "values": []}
+        for f, _, value in read_fields(layer_bytes):
+            if f == 15:
+                layer["version"] = value
+            elif f == 1:
+                layer["name"] = value.decode("utf-8")
+            elif f == 2:
+                layer["features"].append({ff: v for ff, _, v in read_fields(value)})
+            elif f == 3:
+                layer["keys"].append(value.decode("utf-8"))
+            elif f == 4:
+                layer["values"].append(decode_value(value))
+            elif f == 5:
+                layer["extent"] = value
+        layers[layer["name"]] = layer
+    return layers
+
+
+def feature_point(feature):
+    command, x, y = packed(feature[4])
+    assert command == (1 & 0x7) | (1 << 3)  # MoveTo, 1 点
+    return unzigzag(x), unzigzag(y)
+
+
+def feature_props(layer, feature):
+    tags = packed(feature.get(2, b""))
+    return {layer["keys"][k]: layer["values"][v] for k, v in zip(tags[::2], tags[1::2])}
+
+
+def test_point_layer_round_trip():
+    z, x, y = 14, *tile_of(35.6812, 139.7671, 14)
+    features = [
+        (1, 35.6812, 139.7671, {"id": 1, "category": "road", "status": "new", "rating": 4.5, "urgent": True}),
+        (2, 35.6813, 139.7672, {"id": 2, "category": "road", "status": None}),
+    ]
+    layer = decode_tile(encode_point_layer("reports", z, x, y, features))["reports"]
+
+    assert layer["version"] == 2
+    assert layer["extent"] == TILE_EXTENT
+    assert [f[1] for f in layer["features"]] == [1, 2]
+    assert all(f[3] == 1 for f in layer["features"])  # POINT
+    assert feature_props(layer, layer["features"][0]) == {
+        "id": 1, "category": "road", "status": "new", "rating": 4.5, "urgent": True,
+    }
+    # None の属性は書かない。同じキー・値は共有される
+    assert feature_props(layer, layer["features"][1]) == {"id": 2, "category": "road"}
+    assert layer["keys"].count("category") == 1
+    assert layer["values"].count("road") == 1
+
+
+def test_point_coordinates_map_back_into_tile():
+    z = 12
+    lat, lng = 35.6812, 139.7671
+    x, y = tile_of(lat, lng, z)
+    layer = decode_tile(encode_point_layer("reports", z, x, y, [(7, lat, lng, {})]))["reports"]
+    px, py = feature_point(layer["features"][0])
+    assert 0 <= px < TILE_EXTENT and 0 <= py < TILE_EXTENT
+    n = 1 << z
+    mx, my = mercator(lat, lng)
+    assert abs((x + px / TILE_EXTENT) / n - mx) <= 1 / (n * TILE_EXTENT)
+    assert abs((y + py / TILE_EXTENT) / n - my) <= 1 / (n * TILE_EXTENT)
+
+
+def test_negative_coordinates_outside_tile():
+    # 隣のタイルの点は負の座標 (zigzag) になる
+    z = 10
+    x, y = tile_of(35.0, 139.0, z)
+    min_lng, _, _, max_lat = tile_bounds(z, x, y)
+    layer = decode_tile(encode_point_layer("reports", z, x, y, [(1, max_lat + 0.01, min_lng - 0.01, {})]))["reports"]
+    px, py = feature_point(layer["features"][0])
+    assert px < 0 and py < 0
+
+
+def test_empty_layer():
+    layer = decode_tile(encode_point_layer("reports", 0, 0, 0, []))["reports"]
+    assert layer["features"] == [] and layer["keys"] == [] and layer["values"] == []
+
+
+@pytest.mark.parametrize("z", [0, 1, 5, 16])
+def test_tile_bounds_contain_tile_of(z):
+    lat, lng = -33.8688, 151.2093
+    x, y = tile_of(lat, lng, z)
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    assert min_lng <= lng < max_lng
+    assert min_lat <= lat < max_lat
+
+
+def test_tile_of_clamps_edges():
+    assert tile_of(90.0, 180.0, 3) == (7, 0)
+    assert tile_of(-90.0, -180.0, 3) == (0, 7)
+
+
+def test_decodes_with_reference_library():
+    mapbox_vector_tile = pytest.importorskip("mapbox_vector_tile")
+    z, x, y = 14, *tile_of(35.6812, 139.7671, 14)
+    data = encode_point_layer("reports", z, x, y, [(3, 35.6812, 139.7671, {"category": "road", "id": 3})])
+    decoded = mapbox_vector_tile.decode(data, default_options={"y_coord_down": True})
+    feature, = decoded["reports"]["features"]
+    assert feature["id"] == 3
+    assert feature["properties"] == {"category": "road", "id": 3}
+    assert feature["geometry"]["type"] == "Point"
@@ -0,0 +1,126 @@
+import pytest
+from sqlalchemy import event
+
+# 一覧 API のクエリ数がページ内のレポート数に依存しないこと (画像・ユーザーはページ単位でまとめて読む) を確かめる
+PAGE_SIZE = 30
+
+
+@pytest.fixture(scope="module")
+def world(main):
+    from fastapi import APIRouter, FastAPI
+    from fastapi.routing import APIRoute
+    from fastapi.testclient import TestClient
+
+    # main.app は include_router や SPA の catch-all のあとにルートを定義しているので、テスト用に組み直す
+    app = FastAPI()
+    app.include_router(main.admin_router)
+    app.include_router(main.company_router)
+    app.include_router(main.city_router)
+    app_routes = APIRouter()
+    app_routes.routes.extend(r for r in main.app.routes if isinstance(r, APIRoute) and r.endpoint is not main.spa_fallback)
+    app.include_router(app_routes)
+
+    # 画像ファイルは作らないのでサムネイル生成は走らせない (計測中に別スレッドのクエリが混ざらないように)
+    patch = pytest.MonkeyPatch()
+    patch.setattr(main.thumbnail_worker, "submit", lambda image_id, src: None)
+    db = main.SessionLocal()
+    city_org = main.Organization(name="Test City", code="CITY-QC", is_company=False)
+    company_org = main.Organization(name="Test Co", code="CO-QC", is_company=True)
+    db.add_all([city_org, company_org])
+    db.flush()
+    users = {
+        "city": main.User(email="city@qc", password="x", code="QC-CITY", user_type="city", role="city", org_id=city_org.id),
+        "company": main.User(email="co@qc", password="x", code="QC-CO", user_type="company", org_id=company_org.id),
+        "admin": main.User(email="admin@qc", password="x", code="QC-ADM", user_type="admin", is_admin=True),
+    }
+    reporters = [main.User(email=f"r{i}@qc", password="x", code=f"QC-R{i:03d}") for i in range(PAGE_SIZE)]
+    db.add_all([*users.values(), *reporters])
+    db.commit()
+
+    current = {"id": None}
+
+    def current_user(db=main.Depends(main.get_db)):
+        return db.get(main.User, current["id"])
+
+    for dependency in (main.get_current_user, main.city_required, main.admin_required):
+        app.dependency_overrides[dependency] = current_user
+
+    state = {"db": db, "main": main, "users": users, "reporters": reporters, "current": current,
+             "company_org": company_org, "client": TestClient(app)}
+    yield state
+    db.close()
+    patch.undo()
+
+
+def add_reports(world, n, owner=None):
+    main, db = world["main"], world["db"]
+    city, company_org = world["users"]["city"], world["company_org"]
+    for i in range(n):
+        reporter = owner or world["reporters"][i % len(world["reporters"])]
+        report = main.Report(
+            lat=35.68 + i * 0.0001, lng=139.76, category="road", status="new", label="city",
+            org_id=company_org.id, user_id=reporter.id, title=f"r{i}",
+        )
+        db.add(report)
+        db.flush()
+        db.add_all(main.Image(report_id=report.id, image_path=f"/static/uploads/qc-{report.id}-{k}.jpg") for k in range(2))
+        db.add(main.ReportAssignment(report_id=report.id, org_id=company_org.id, assigned_by=city.id, status="assigned"))
+    db.commit()
+
+
+def clear_reports(world):
+    main, db = world["main"], world["db"]
+    db.query(main.ReportAssignment).delete()
+    db.query(main.Image).delete()
+    db.query(main.Report).delete()
+    db.commit()
+
+
+# (名前, 呼び出すユーザー, パス, 応答からページ内の件数を取り出す関数)
+ENDPOINTS = [
+    ("city reports", "city", f"/api/city/reports?limit={PAGE_SIZE}", lambda r: len(r["features"])),
+    ("city reports cursor", "city", f"/api/city/reports?limit={PAGE_SIZE}&cursor=", lambda r: len(r["features"])),
+    ("city assignments", "city", "/api/city/assignments", len),
+    ("company reports", "company", f"/api/company/reports?limit={PAGE_SIZE}", lambda r: len(r["features"])),
+    ("company assignments", "company", "/api/company/assignments", len),
+    ("bbox", "city", "/api/reports/bbox?minLng=139&minLat=35&maxLng=140&maxLat=36", lambda r: len(r["features"])),
+    ("own reports", "reporter", "/reports", lambda r: len(r["features"])),
+    ("admin reports", "admin", "/api/admin/reports", len),
+]
+
+
+def count_queries(world, who, path, size_of):
+    main, client = world["main"], world["client"]
+    user = world["reporters"][0] if who == "reporter" else world["users"][who]
+    world["current"]["id"] = user.id
+    # 1 回目はキャッシュやマッチャーの初期化を含むので数えない
+    warm = client.get(path)
+    assert warm.status_code == 200, warm.text
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(main.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(main.engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return len(statements), size_of(response.json())
+
+
+@pytest.mark.parametrize("name, who, path, size_of", ENDPOINTS, ids=[e[0] for e in ENDPOINTS])
+def test_query_count_does_not_grow_with_page(world, name, who, path, size_of):
+    owner = world["reporters"][0] if who == "reporter" else None
+    clear_reports(world)
+    add_reports(world, 1, owner)
+    single, single_size = count_queries(world, who, path, size_of)
+
+    clear_reports(world)
+    add_reports(world, PAGE_SIZE, owner)
+    page, page_size = count_queries(world, who, path, size_of)
+
+    assert single_size >= 1
+    assert page_size > single_size
+    assert page == single, f"{name}: {single} queries for 1 report, {page} for {page_size}"
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+
+from utils.upsert import upsert_increment
+
+
+@pytest.fixture
+def counters():
+    engine = create_engine("sqlite://")
+    table = Table(
+        "counters", MetaData(),
+        Column("key", String, primary_key=True),
+        Column("value", Integer, nullable=False),
+        Column("label", String),
+        Column("note", String),
+    )
+    table.create(engine)
+    yield engine, table
+    engine.dispose()
+
+
+def rows(engine, table):
+    with engine.connect() as conn:
+        return [tuple(r) for r in conn.execute(select(table).order_by(table.c.key))]
+
+
+def test_inserts_then_increments(counters):
+    engine, table = counters
+    with engine.begin() as conn:
+        upsert_increment(conn, table, {"key": "a"}, "value", 2, defaults={"note": "first"}, label="x")
+        upsert_increment(conn, table, {"key": "a"}, "value", 3, defaults={"note": "second"}, label="y")
+        upsert_increment(conn, table, {"key": "b"}, "value", -1)
+    # defaults は作るときだけ、updates は毎回上書きする
+    assert rows(engine, table) == [("a", 5, "y", "first"), ("b", -1, None, None)]
+
+
+def test_fallback_without_on_conflict(counters, monkeypatch):
+    # ON CONFLICT の無い方言では UPDATE → INSERT に切り替わる
+    engine, table = counters
+    monkeypatch.setattr("utils.upsert._DIALECT_INSERTS", {})
+    with engine.begin() as conn:
+        upsert_increment(conn, table, {"key": "a"}, "value", 1, defaults={"note": "n"})
+        upsert_increment(conn, table, {"key": "a"}, "value", 4, label="z")
+    assert rows(engine, table) == [("a", 5, "z", "n")]
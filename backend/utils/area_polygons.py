@@ -0,0 +1,149 @@
+import json
+import threading
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# STR 方式で一括構築する読み取り専用 R-tree。エリア境界ポリゴンの点検索に使う
+NODE_CAPACITY = 16
+
+Ring = List[Tuple[float, float]]
+BBox = Tuple[float, float, float, float]
+
+
+def parse_polygons(geometry) -> List[List[Ring]]:
+    """GeoJSON の Polygon / MultiPolygon を [[外周, 穴...], ...] (lng, lat) に変換する"""
+    if isinstance(geometry, str):
+        geometry = json.loads(geometry)
+    if not geometry:
+        return []
+    if geometry.get("type") == "Feature":
+        geometry = geometry.get("geometry") or {}
+    kind = geometry.get("type")
+    coords = geometry.get("coordinates") or []
+    if kind == "Polygon":
+        coords = [coords]
+    elif kind != "MultiPolygon":
+        raise ValueError(f"Unsupported geometry type: {kind}")
+    return [[[(float(p[0]), float(p[1])) for p in ring] for ring in polygon] for polygon in coords if polygon]
+
+
+def _ring_contains(ring: Ring, x: float, y: float) -> bool:
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _ring_area(ring: Ring) -> float:
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]))) / 2
+
+
+class _Entry:
+    __slots__ = ("bbox", "area_id", "city_org_id", "polygon", "size")
+
+    def __init__(self, area_id, city_org_id, polygon):
+        xs = [x for x, _ in polygon[0]]
+        ys = [y for _, y in polygon[0]]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        self.area_id = area_id
+        self.city_org_id = city_org_id
+        self.polygon = polygon
+        self.size = _ring_area(polygon[0])
+
+    def contains(self, x: float, y: float) -> bool:
+        return _ring_contains(self.polygon[0], x, y) and not any(
+            _ring_contains(hole, x, y) for hole in self.polygon[1:]
+        )
+
+
+def _union(boxes: Iterable[BBox]) -> BBox:
+    boxes = list(boxes)
+    return (
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes),
+    )
+
+
+def _str_pack(items: list) -> List[Tuple[BBox, list]]:
+    """items (bbox 属性を持つ) を x → y の順に並べて NODE_CAPACITY 個ずつのノードにまとめる"""
+    count = len(items)
+    leaves = -(-count // NODE_CAPACITY)
+    slices = max(1, int(leaves ** 0.5 + 0.999999))
+    per_slice = slices * NODE_CAPACITY
+    items = sorted(items, key=lambda e: (e.bbox[0] + e.bbox[2]))
+    nodes = []
+    for s in range(0, count, per_slice):
+        column = sorted(items[s:s + per_slice], key=lambda e: (e.bbox[1] + e.bbox[3]))
+        for n in range(0, len(column), NODE_CAPACITY):
+            children = column[n:n + NODE_CAPACITY]
+            nodes.append(_Node(_union(c.bbox for c in children), children))
+    return nodes
+
+
+class _Node:
+    __slots__ = ("bbox", "children")
+
+    def __init__(self, bbox, children):
+        self.bbox = bbox
+        self.children = children
+
+
+class AreaIndex:
+    """エリア境界の R-tree。点を含むエリアのうち最も面積の小さいものを返す"""
+
+    def __init__(self, areas: Iterable[Tuple[int, Optional[int], str]]):
+        # areas: (area_id, city_org_id, GeoJSON geometry)
+        entries = []
+        for area_id, city_org_id, geometry in areas:
+            for polygon in parse_polygons(geometry):
+                if len(polygon[0]) >= 3:
+                    entries.append(_Entry(area_id, city_org_id, polygon))
+        level = entries
+        while len(level) > NODE_CAPACITY:
+            level = _str_pack(level)
+        self._root = _Node(_union(e.bbox for e in level), level) if level else None
+
+    def __bool__(self):
+        return self._root is not None
+
+    def locate(self, lat: float, lng: float) -> Optional[Tuple[int, Optional[int]]]:
+        if self._root is None:
+            return None
+        best = None
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for child in node.children:
+                b = child.bbox
+                if not (b[0] <= lng <= b[2] and b[1] <= lat <= b[3]):
+                    continue
+                if isinstance(child, _Node):
+                    stack.append(child)
+                elif child.contains(lng, lat) and (best is None or child.size < best.size):
+                    best = child
+        return (best.area_id, best.city_org_id) if best else None
+
+
+_index: Optional[AreaIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_area_index(load: Callable[[], Iterable[Tuple[int, Optional[int], str]]]) -> AreaIndex:
+    global _index
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AreaIndex(load())
+            index = _index
+    return index
+
+
+def invalidate_area_index():
+    global _index
+    with _index_lock:
+        _index = None
@@ -1,16 +1,104 @@
+import threading
+from collections import deque
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from models import Area, Organization
 
+
+class AreaMatcher:
+    """全エリア名から作った Aho-Corasick オートマトン。住所を 1 回走査して含まれるエリアを探す"""
+
+    def __init__(self, areas: Iterable[Tuple[int, str, Optional[int]]]):
+        # areas: (area_id, name, city_org_id)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[int]] = [None]  # そのノードで終わる最小の area_id (fail 先も含む)
+        self._city_org: Dict[int, Optional[int]] = {}
+        for area_id, name, city_org_id in areas:
+            if not name:
+                continue
+            self._city_org[area_id] = city_org_id
+            node = 0
+            for ch in name:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                node = nxt
+            if self._out[node] is None or area_id < self._out[node]:
+                self._out[node] = area_id
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                inherited = self._out[self._fail[nxt]]
+                if inherited is not None and (self._out[nxt] is None or inherited < self._out[nxt]):
+                    self._out[nxt] = inherited
+                queue.append(nxt)
+
+    def match(self, address: Optional[str]) -> Optional[Tuple[int, Optional[int]]]:
+        """住所に含まれるエリアのうち id が最小のものを (area_id, city_org_id) で返す"""
+        if not address:
+            return None
+        best = None
+        node = 0
+        for ch in address:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            found = self._out[node]
+            if found is not None and (best is None or found < best):
+                best = found
+        return (best, self._city_org[best]) if best is not None else None
+
+
+_matcher: Optional[AreaMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_area_matcher(load: Callable[[], Iterable[Tuple[int, str, Optional[int]]]]) -> AreaMatcher:
+    global _matcher
+    matcher = _matcher
+    if matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = AreaMatcher(load())
+            matcher = _matcher
+    return matcher
+
+
+def invalidate_area_matcher():
+    global _matcher
+    with _matcher_lock:
+        _matcher = None
+
+
+def load_area_rows(db: Session, area_model=Area) -> List[Tuple[int, str, Optional[int]]]:
+    areas = db.query(area_model).order_by(area_model.id).all()
+    return [(a.id, a.name, find_city_org_id(a)) for a in areas]
+
+
 def find_matching_area(address: str, db: Session) -> Optional[Area]:
-    areas = db.query(Area).all()
-    for area in areas:
-        if area.name and area.name in address:
-            return area
-    return None
+    match = get_area_matcher(lambda: load_area_rows(db)).match(address)
+    return db.get(Area, match[0]) if match else None
 
 def find_city_org_by_area(area: Area) -> Optional[Organization]:
     for org in area.organizations:
         if not org.is_company:
             return org
     return None
+
+def find_city_org_id(area: Area) -> Optional[int]:
+    org = find_city_org_by_area(area)
+    return org.id if org else None
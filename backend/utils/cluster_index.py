@@ -0,0 +1,126 @@
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ズーム z ではタイル 1 枚 (256px) を CELLS_PER_TILE x CELLS_PER_TILE のセルに分けて集約する
+CELLS_PER_TILE = 4
+CLUSTER_MAX_ZOOM = 12
+
+
+def mercator(lat: float, lng: float) -> Tuple[float, float]:
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lng + 180.0) / 360.0
+    s = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return x, y
+
+
+def cell_key(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    n = (1 << zoom) * CELLS_PER_TILE
+    x, y = mercator(lat, lng)
+    return min(int(x * n), n - 1), min(int(y * n), n - 1)
+
+
+class ClusterIndex:
+    """ズームごとのグリッドにステータス別の件数と座標の合計を持つ階層クラスタ"""
+
+    def __init__(self, min_zoom: int = 0, max_zoom: int = CLUSTER_MAX_ZOOM):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        # levels[zoom][(ix, iy)][status] = [count, sum_lat, sum_lng]
+        self.levels: Dict[int, Dict[Tuple[int, int], Dict[str, list]]] = {
+            z: {} for z in range(min_zoom, max_zoom + 1)
+        }
+
+    def add(self, lat: float, lng: float, status: Optional[str], sign: int = 1):
+        status = status or "new"
+        for zoom, cells in self.levels.items():
+            key = cell_key(lat, lng, zoom)
+            cell = cells.setdefault(key, {})
+            acc = cell.setdefault(status, [0, 0.0, 0.0])
+            acc[0] += sign
+            acc[1] += sign * lat
+            acc[2] += sign * lng
+            if acc[0] <= 0:
+                del cell[status]
+                if not cell:
+                    del cells[key]
+
+    def remove(self, lat: float, lng: float, status: Optional[str]):
+        self.add(lat, lng, status, sign=-1)
+
+    def clusters(
+        self,
+        zoom: int,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        status: Optional[str] = None,
+    ) -> List[dict]:
+        zoom = min(max(zoom, self.min_zoom), self.max_zoom)
+        features = []
+        for cell in self.levels[zoom].values():
+            stats = {s: acc for s, acc in cell.items() if status is None or s == status}
+            count = sum(acc[0] for acc in stats.values())
+            if not count:
+                continue
+            lat = sum(acc[1] for acc in stats.values()) / count
+            lng = sum(acc[2] for acc in stats.values()) / count
+            if bbox and not (bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+                continue
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lng, lat]},
+                "properties": {
+                    "cluster": True,
+                    "point_count": count,
+                    "status_counts": {s: acc[0] for s, acc in stats.items()},
+                },
+            })
+        return features
+
+    @classmethod
+    def from_points(cls, points: Iterable[Tuple[float, float, Optional[str]]], zoom: int) -> "ClusterIndex":
+        index = cls(min_zoom=zoom, max_zoom=zoom)
+        for lat, lng, status in points:
+            index.add(lat, lng, status)
+        return index
+
+
+class ClusterStore:
+    """label x category ごとの ClusterIndex をプロセス内に保持し、レポートの増減を反映する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: Dict[Tuple[str, Optional[str]], ClusterIndex] = {}
+        self._loaded = False
+
+    def _apply(self, row: dict, sign: int):
+        for key in ((row["label"], None), (row["label"], row["category"])):
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = ClusterIndex()
+            index.add(row["lat"], row["lng"], row["status"], sign=sign)
+
+    def load(self, rows: Iterable[dict]):
+        with self._lock:
+            self._indexes = {}
+            for row in rows:
+                self._apply(row, 1)
+            self._loaded = True
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def update(self, old: Optional[dict], new: Optional[dict]):
+        if not self._loaded:
+            return
+        with self._lock:
+            if old:
+                self._apply(old, -1)
+            if new:
+                self._apply(new, 1)
+
+    def clusters(self, label: str, category: Optional[str], zoom: int, bbox=None, status=None) -> List[dict]:
+        with self._lock:
+            index = self._indexes.get((label, category))
+            return index.clusters(zoom, bbox=bbox, status=status) if index else []
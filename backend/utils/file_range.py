@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+# HTTP Range (単一範囲の bytes=...) の解釈と、その範囲のファイル読み出し
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Range ヘッダーを (start, end) (end を含む) にする。ヘッダーが無い・解釈できない場合は None (全体を返す)"""
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        # 複数範囲は扱わず全体を返す
+        return None
+    first, last = (part.strip() for part in spec.split("-", 1))
+    # 数値として読めなければ無視する。RangeNotSatisfiable も ValueError なので判定は try の外で行う
+    try:
+        start = int(first) if first else None
+        last_pos = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        # bytes=-N は末尾の N バイト
+        if last_pos is None:
+            return None
+        if last_pos <= 0:
+            raise RangeNotSatisfiable(header)
+        start, end = max(size - last_pos, 0), size - 1
+    else:
+        end = min(last_pos, size - 1) if last_pos is not None else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def iter_file_range(path: Path, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,231 @@
+import datetime
+import io
+import json
+import struct
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # GeoParquet 出力を使わない環境では不要
+    pa = None
+    pq = None
+
+# GIS 向けエクスポート (GeoParquet / FlatGeobuf)。行はバッチごとに書き出し、メモリには 1 バッチ分しか持たない
+#   fields: [(列名, "int" | "float" | "str" | "datetime"), ...]
+#   rows:   (lng, lat, 属性値...) のタプル
+Field = Tuple[str, str]
+
+
+def _chunks(rows: Iterable[Sequence], size: int) -> Iterator[List[Sequence]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _wkb_point(lng: float, lat: float) -> bytes:
+    return struct.pack("<BIdd", 1, 1, lng, lat)
+
+
+# --- GeoParquet ---------------------------------------------------------------
+
+def geoparquet_available() -> bool:
+    return pa is not None
+
+
+class _ChunkSink(io.RawIOBase):
+    """pyarrow の書き込み先。書かれたバイト列を溜めておき、take() で取り出す"""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema(fields: Sequence[Field]):
+    types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "datetime": pa.timestamp("us", tz="UTC")}
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"]}},
+    }
+    return pa.schema(
+        [pa.field(name, types[kind]) for name, kind in fields] + [pa.field("geometry", pa.binary())],
+        metadata={"geo": json.dumps(geo)},
+    )
+
+
+def _arrow_value(kind: str, value):
+    if kind == "datetime" and value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def iter_geoparquet(rows: Iterable[Sequence], fields: Sequence[Field], batch_size: int = 1000) -> Iterator[bytes]:
+    """GeoParquet 1.0 (WKB Point, CRS84)。batch_size 行ごとに 1 row group として書き出す"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for GeoParquet export")
+    schema = _arrow_schema(fields)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for batch in _chunks(rows, batch_size):
+            columns = [
+                [_arrow_value(kind, row[i + 2]) for row in batch] for i, (_, kind) in enumerate(fields)
+            ]
+            columns.append([_wkb_point(row[0], row[1]) for row in batch])
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+# --- FlatGeobuf ---------------------------------------------------------------
+# https://flatgeobuf.org の header.fbs / feature.fbs を手書きの FlatBuffers で出力する。
+# 空間インデックスは付けない (index_node_size = 0) ので、件数を知らなくても先頭から順に書ける。
+FGB_MAGIC = bytes([0x66, 0x67, 0x62, 0x03, 0x66, 0x67, 0x62, 0x00])
+FGB_POINT = 1
+FGB_COLUMN_TYPES = {"int": 7, "float": 10, "str": 11, "datetime": 13}  # Long / Double / String / DateTime
+_SCALARS = {"u8": "<B", "bool": "<?", "u16": "<H", "i32": "<i", "u32": "<I", "u64": "<Q", "f64": "<d"}
+
+
+class _FlatBuffer:
+    """前から順に書く最小限の FlatBuffers ビルダー (vtable → テーブル → 子オブジェクトの順に並べる)"""
+
+    def __init__(self):
+        self.buf = bytearray(4)  # ルートテーブルへの uoffset
+
+    def _pad(self, align: int, extra: int = 0):
+        while (len(self.buf) + extra) % align:
+            self.buf.append(0)
+
+    def _patch_offset(self, at: int, target: int):
+        struct.pack_into("<I", self.buf, at, target - at)
+
+    def finish(self, root) -> bytes:
+        pos = self.table(root)
+        self._patch_offset(0, pos)
+        self._pad(8)
+        return bytes(self.buf)
+
+    def table(self, fields) -> int:
+        """fields: [(slot, kind, value)]。kind は _SCALARS のキー / "str" / "table" / "tables" / "vec:<型>" """
+        fields = [f for f in fields if f[2] is not None]
+        sizes = {slot: struct.calcsize(_SCALARS[kind]) if kind in _SCALARS else 4 for slot, kind, _ in fields}
+        layout, cursor = {}, 4
+        for slot, _, _ in sorted(fields, key=lambda f: -sizes[f[0]]):
+            cursor += -cursor % sizes[slot]
+            layout[slot] = cursor
+            cursor += sizes[slot]
+        inline_size = cursor
+        slots = max((slot for slot, _, _ in fields), default=-1) + 1
+
+        self._pad(2)
+        vtable = len(self.buf)
+        self.buf += struct.pack(f"<HH{slots}H", 4 + 2 * slots, inline_size, *[layout.get(i, 0) for i in range(slots)])
+        self._pad(8)
+        start = len(self.buf)
+        self.buf += bytes(inline_size)
+        struct.pack_into("<i", self.buf, start, start - vtable)
+        children = []
+        for slot, kind, value in fields:
+            if kind in _SCALARS:
+                struct.pack_into(_SCALARS[kind], self.buf, start + layout[slot], value)
+            else:
+                children.append((start + layout[slot], kind, value))
+        for at, kind, value in children:
+            self._patch_offset(at, self._child(kind, value))
+        return start
+
+    def _child(self, kind: str, value) -> int:
+        if kind == "str":
+            data = value.encode("utf-8")
+            self._pad(4)
+            pos = len(self.buf)
+            self.buf += struct.pack("<I", len(data)) + data + b"\0"
+            return pos
+        if kind == "table":
+            return self.table(value)
+        if kind == "tables":
+            self._pad(4)
+            pos = len(self.buf)
+            self.buf += struct.pack("<I", len(value)) + bytes(4 * len(value))
+            for i, item in enumerate(value):
+                self._patch_offset(pos + 4 + 4 * i, self.table(item))
+            return pos
+        fmt = _SCALARS[kind.split(":", 1)[1]]
+        self._pad(max(4, struct.calcsize(fmt)), 4)
+        pos = len(self.buf)
+        self.buf += struct.pack("<I", len(value)) + struct.pack(f"<{len(value)}{fmt[1]}", *value)
+        return pos
+
+
+def _fgb_header(name: str, fields: Sequence[Field]) -> bytes:
+    columns = [[(0, "str", field), (1, "u8", FGB_COLUMN_TYPES[kind])] for field, kind in fields]
+    header = _FlatBuffer().finish([
+        (0, "str", name),
+        (2, "u8", FGB_POINT),
+        (7, "tables", columns),
+        (8, "u64", 0),  # 件数不明
+        (9, "u16", 0),  # インデックスなし
+        (10, "table", [(0, "str", "EPSG"), (1, "i32", 4326)]),
+    ])
+    return struct.pack("<I", len(header)) + header
+
+
+def _fgb_properties(fields: Sequence[Field], values: Sequence) -> bytes:
+    out = bytearray()
+    for i, ((_, kind), value) in enumerate(zip(fields, values)):
+        if value is None:
+            continue
+        out += struct.pack("<H", i)
+        if kind == "int":
+            out += struct.pack("<q", value)
+        elif kind == "float":
+            out += struct.pack("<d", value)
+        else:
+            if kind == "datetime":
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=datetime.timezone.utc)
+                value = value.isoformat()
+            data = str(value).encode("utf-8")
+            out += struct.pack("<I", len(data)) + data
+    return bytes(out)
+
+
+def _fgb_feature(fields: Sequence[Field], row: Sequence) -> bytes:
+    feature = _FlatBuffer().finish([
+        (0, "table", [(1, "vec:f64", (row[0], row[1]))]),
+        (1, "vec:u8", _fgb_properties(fields, row[2:])),
+    ])
+    return struct.pack("<I", len(feature)) + feature
+
+
+def iter_flatgeobuf(
+    rows: Iterable[Sequence], fields: Sequence[Field], name: str = "reports", batch_size: int = 1000
+) -> Iterator[bytes]:
+    yield FGB_MAGIC + _fgb_header(name, fields)
+    for batch in _chunks(rows, batch_size):
+        yield b"".join(_fgb_feature(fields, row) for row in batch)
@@ -0,0 +1,32 @@
+from typing import List, Optional, Tuple
+
+# 0.01 度 (約 1km) 四方のグリッドで lat/lng をセル番号に変換する
+GRID_SIZE = 0.01
+GRID_COLS = int(round(360 / GRID_SIZE))
+GRID_ROWS = int(round(180 / GRID_SIZE))
+
+# これより多くの行にまたがる bbox はセル範囲ではなく lat/lng インデックスで検索する
+MAX_CELL_ROWS = 64
+
+
+def _col(lng: float) -> int:
+    return min(max(int((lng + 180) // GRID_SIZE), 0), GRID_COLS - 1)
+
+
+def _row(lat: float) -> int:
+    return min(max(int((lat + 90) // GRID_SIZE), 0), GRID_ROWS - 1)
+
+
+def cell_of(lat: Optional[float], lng: Optional[float]) -> Optional[int]:
+    if lat is None or lng is None:
+        return None
+    return _row(lat) * GRID_COLS + _col(lng)
+
+
+def cell_ranges(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Optional[List[Tuple[int, int]]]:
+    """bbox を覆うセル番号の範囲 (行ごとに連続) を返す。行数が多すぎる場合は None"""
+    row0, row1 = _row(min_lat), _row(max_lat)
+    if row1 - row0 + 1 > MAX_CELL_ROWS:
+        return None
+    col0, col1 = _col(min_lng), _col(max_lng)
+    return [(r * GRID_COLS + col0, r * GRID_COLS + col1) for r in range(row0, row1 + 1)]
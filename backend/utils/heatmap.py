@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# 緯度経度の固定グリッド (一辺 cell_size 度) でレポートの密度を数える。
+# セル番号は表示範囲に依存しないので、同じフィルター・解像度なら 1 つの集計をどの bbox にも使える
+HEATMAP_CELL_SIZES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+# 1 回の密グリッド応答に含めるセル数の上限
+MAX_GRID_CELLS = 250_000
+# 読み込み中に更新が入ったときに読み直す回数
+LOAD_RETRIES = 3
+
+
+class GridTooLarge(ValueError):
+    pass
+
+
+class HeatmapLayer:
+    """1 つのフィルター x 解像度の密度集計。セルは row * n_cols + col の整数キーで持つ"""
+
+    def __init__(self, cell_size: float, points: np.ndarray):
+        self.cell_size = cell_size
+        self.n_cols = int(round(360 / cell_size)) + 1
+        keys, counts = np.unique(self._keys(points[:, 0], points[:, 1]), return_counts=True)
+        self._counts: Dict[int, int] = dict(zip(keys.tolist(), counts.tolist()))
+        self._arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def _row(self, lat):
+        return np.floor((np.asarray(lat, dtype=np.float64) + 90.0) / self.cell_size).astype(np.int64)
+
+    def _col(self, lng):
+        return np.floor((np.asarray(lng, dtype=np.float64) + 180.0) / self.cell_size).astype(np.int64)
+
+    def _keys(self, lat, lng):
+        return self._row(lat) * self.n_cols + self._col(lng)
+
+    def add(self, lat: float, lng: float, sign: int = 1):
+        key = int(self._keys(lat, lng))
+        count = self._counts.get(key, 0) + sign
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+        self._arrays = None
+
+    def _cell_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        # 更新のあとに最初に読むときだけ dict から配列を作り直す
+        if self._arrays is None:
+            keys = np.fromiter(self._counts.keys(), dtype=np.int64, count=len(self._counts))
+            counts = np.fromiter(self._counts.values(), dtype=np.int64, count=len(self._counts))
+            self._arrays = keys, counts
+        return self._arrays
+
+    def grid(self, bbox: Tuple[float, float, float, float]) -> Tuple[Tuple[float, float], np.ndarray]:
+        """bbox (min_lng, min_lat, max_lng, max_lat) を覆う密グリッド。
+        (南西端のセルの南西角 (lat, lng), 件数の 2 次元配列 [行 = 南から, 列 = 西から]) を返す"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        row0, row1 = int(self._row(min_lat)), int(self._row(max_lat))
+        col0, col1 = int(self._col(min_lng)), int(self._col(max_lng))
+        shape = (row1 - row0 + 1, col1 - col0 + 1)
+        if shape[0] * shape[1] > MAX_GRID_CELLS:
+            raise GridTooLarge(f"Grid of {shape[0]}x{shape[1]} cells exceeds {MAX_GRID_CELLS}")
+        keys, counts = self._cell_arrays()
+        rows, cols = np.divmod(keys, self.n_cols)
+        mask = (rows >= row0) & (rows <= row1) & (cols >= col0) & (cols <= col1)
+        dense = np.zeros(shape, dtype=np.int64)
+        dense[rows[mask] - row0, cols[mask] - col0] = counts[mask]
+        origin = (row0 * self.cell_size - 90.0, col0 * self.cell_size - 180.0)
+        return origin, dense
+
+
+def grid_features(origin: Tuple[float, float], dense: np.ndarray, cell_size: float) -> List[dict]:
+    """密グリッドの 0 でないセルを GeoJSON Polygon にする (座標は 6 桁に丸める)"""
+    features = []
+    for row, col in zip(*np.nonzero(dense)):
+        south = round(origin[0] + row * cell_size, 6)
+        west = round(origin[1] + col * cell_size, 6)
+        north = round(south + cell_size, 6)
+        east = round(west + cell_size, 6)
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]],
+            },
+            "properties": {"count": int(dense[row, col])},
+        })
+    return features
+
+
+class HeatmapStore:
+    """フィルター x 解像度ごとの HeatmapLayer をプロセス内に保持し、レポートの増減を反映する (LRU)"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._layers: "OrderedDict[Hashable, Tuple[dict, HeatmapLayer]]" = OrderedDict()
+        # update / clear のたびに増える。load() の間に変わったら、その結果は更新を取りこぼしているので使わない
+        self._generation = 0
+
+    @staticmethod
+    def _key(filters: dict, cell_size: float) -> Hashable:
+        return tuple(sorted(filters.items())), cell_size
+
+    def grid(
+        self, filters: dict, cell_size: float, bbox: Tuple[float, float, float, float], load: Callable[[], np.ndarray]
+    ) -> Tuple[Tuple[float, float], np.ndarray]:
+        """filters に一致するレポートの bbox 内の密グリッド (HeatmapLayer.grid を参照)。
+        filters は {列名: 値} (None の項目は無視)、load はキャッシュが無いときに (lat, lng) の N x 2 配列を返す"""
+        filters = {k: v for k, v in filters.items() if v is not None}
+        key = self._key(filters, cell_size)
+        for _ in range(LOAD_RETRIES):
+            with self._lock:
+                hit = self._layers.get(key)
+                if hit:
+                    self._layers.move_to_end(key)
+                    return hit[1].grid(bbox)
+                generation = self._generation
+            layer = HeatmapLayer(cell_size, load())
+            with self._lock:
+                if self._generation == generation:
+                    self._layers[key] = (filters, layer)
+                    while len(self._layers) > self.max_entries:
+                        self._layers.popitem(last=False)
+                    return layer.grid(bbox)
+        # 更新が続いて読み直しきれないときは、最後に読んだ結果をキャッシュせずに返す
+        return layer.grid(bbox)
+
+    def _apply(self, row: dict, sign: int):
+        if row.get("lat") is None or row.get("lng") is None:
+            return
+        for filters, layer in self._layers.values():
+            if all(row.get(k) == v for k, v in filters.items()):
+                layer.add(row["lat"], row["lng"], sign=sign)
+
+    def update(self, old: Optional[dict], new: Optional[dict]):
+        with self._lock:
+            self._generation += 1
+            if old:
+                self._apply(old, -1)
+            if new:
+                self._apply(new, 1)
+
+    def clear(self, *args):
+        with self._lock:
+            self._generation += 1
+            self._layers.clear()
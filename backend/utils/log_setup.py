@@ -0,0 +1,125 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+# ログの出力設定。アプリのスレッドはキューに積むだけで、整形とファイル書き込みは QueueListener のスレッドが行う
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# uvicorn が自前のハンドラーを付けるロガー。root に流して同じキュー・形式で書き出す
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# JSON に含めないレコード属性。color_message は uvicorn が付ける ANSI 色付きの message の複製
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "taskName", "color_message",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """1 レコード = 1 行の JSON。logger.info(..., extra={...}) の項目もそのまま含める"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """rate の割合だけ通す。always_level 以上 (既定 WARNING) は常に通す"""
+
+    def __init__(self, rate: float, always_level: int = logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.always_level = always_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.always_level or random.random() < self.rate
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # 標準の QueueHandler は呼び出し側で整形してしまうので、引数の埋め込みと例外の文字列化だけにして整形はリスナーに任せる
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: Optional[str]) -> Dict[str, str]:
+    """"sqlalchemy.engine=WARNING,walkaudit.access=INFO" → {ロガー名: レベル}"""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(
+    level: str = "INFO",
+    filename: Optional[str] = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    fmt: str = "json",
+    levels: Optional[Dict[str, str]] = None,
+    stderr: bool = True,
+    queue_size: int = 10000,
+) -> QueueListener:
+    """root ロガーをキュー経由の出力 (ローテーション付きファイル / stderr) に付け替え、リスナーを返す。
+    キューが溢れたときは書き込みを待たずにそのレコードを捨てる"""
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if filename:
+        handlers.append(RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"))
+    if stderr:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_DeferredQueueHandler(records))
+    root.setLevel(level.upper())
+
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+        uvicorn_logger.setLevel(logging.NOTSET)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+    return listener
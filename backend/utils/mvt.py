@@ -0,0 +1,101 @@
+import math
+import struct
+from typing import Iterable, List, Tuple
+
+from utils.cluster_index import mercator
+
+# Mapbox Vector Tile (spec v2) のポイントレイヤーだけを扱う最小限のエンコーダ
+TILE_EXTENT = 4096
+TILE_MAX_ZOOM = 16
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(field: int, value: int) -> bytes:
+    return _key(field, 0) + _varint(value)
+
+
+def _packed_field(field: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value) -> bytes:
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int):
+        return _uint_field(6, _zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """タイルの (min_lng, min_lat, max_lng, max_lat)"""
+    n = 1 << z
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def tile_of(lat: float, lng: float, z: int) -> Tuple[int, int]:
+    n = 1 << z
+    mx, my = mercator(lat, lng)
+    return min(int(mx * n), n - 1), min(int(my * n), n - 1)
+
+
+def encode_point_layer(name: str, z: int, x: int, y: int, features: List[Tuple[int, float, float, dict]]) -> bytes:
+    """features は (id, lat, lng, properties) のリスト。1 レイヤーだけのタイルを返す"""
+    n = 1 << z
+    keys: dict = {}
+    values: dict = {}
+    encoded = []
+    for fid, lat, lng, props in features:
+        mx, my = mercator(lat, lng)
+        px = int(round((mx * n - x) * TILE_EXTENT))
+        py = int(round((my * n - y) * TILE_EXTENT))
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v).__name__, v), len(values)))
+        feature = (
+            _uint_field(1, fid)
+            + (_packed_field(2, tags) if tags else b"")
+            + _uint_field(3, 1)  # POINT
+            + _packed_field(4, [(1 & 0x7) | (1 << 3), _zigzag(px), _zigzag(py)])
+        )
+        encoded.append(_bytes_field(2, feature))
+    layer = (
+        _uint_field(15, 2)
+        + _bytes_field(1, name.encode("utf-8"))
+        + b"".join(encoded)
+        + b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+        + b"".join(_bytes_field(4, _encode_value(v)) for _, v in values)
+        + _uint_field(5, TILE_EXTENT)
+    )
+    return _bytes_field(3, layer)
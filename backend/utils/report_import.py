@@ -0,0 +1,129 @@
+import csv
+import datetime
+import io
+import json
+import zipfile
+from pathlib import PurePosixPath
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+# レポート一括取り込みの入力 (NDJSON / CSV) の読み込みと検証
+#   1 行 = 1 レポート: lat, lng, category は必須
+#   title, description, address, status, created_at (ISO 8601), images (画像 zip 内のファイル名。CSV は ; 区切り)
+IMPORT_FORMATS = ("ndjson", "csv")
+TEXT_FIELDS = ("title", "description", "address", "status")
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+class ArchiveTooLarge(ValueError):
+    pass
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str], fmt: Optional[str] = None) -> str:
+    if fmt:
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"Unsupported import format: {fmt}")
+        return fmt
+    suffix = PurePosixPath(filename or "").suffix.lower()
+    if suffix == ".csv" or (content_type or "").startswith("text/csv"):
+        return "csv"
+    return "ndjson"
+
+
+def iter_records(src: BinaryIO, fmt: str) -> Iterator[Tuple[int, Union[dict, ImportRowError]]]:
+    """(行番号, レコード) を順に返す。JSON として読めない行は ImportRowError を返す (1 始まり、ヘッダーは数えない)"""
+    stream = io.TextIOWrapper(src, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            for row, record in enumerate(csv.DictReader(stream), start=1):
+                yield row, record
+            return
+        row = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row, ImportRowError(f"Invalid JSON: {e.msg}")
+                continue
+            yield row, record if isinstance(record, dict) else ImportRowError("Row must be a JSON object")
+    finally:
+        stream.detach()
+
+
+def _float(record: dict, field: str, low: float, high: float) -> float:
+    value = record.get(field)
+    if value in (None, ""):
+        raise ImportRowError(f"'{field}' is required")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f"'{field}' must be a number")
+    if not low <= value <= high:
+        raise ImportRowError(f"'{field}' out of range")
+    return value
+
+
+def normalize_record(record: dict) -> dict:
+    """入力 1 行を検証し、Report の列名に合わせた dict にする"""
+    out = {
+        "lat": _float(record, "lat", -90, 90),
+        "lng": _float(record, "lng", -180, 180),
+    }
+    category = record.get("category")
+    if not category:
+        raise ImportRowError("'category' is required")
+    out["category"] = str(category)
+    for field in TEXT_FIELDS:
+        value = record.get(field)
+        out[field] = str(value) if value not in (None, "") else None
+    created_at = record.get("created_at")
+    if created_at:
+        try:
+            parsed = datetime.datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+        except ValueError:
+            raise ImportRowError("'created_at' must be ISO 8601")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        out["created_at"] = parsed.astimezone(datetime.timezone.utc)
+    images = record.get("images") or []
+    if isinstance(images, str):
+        images = [name.strip() for name in images.split(";") if name.strip()]
+    out["images"] = [str(name) for name in images]
+    return out
+
+
+class ImageArchive:
+    """画像 zip。ファイル名はパス付きでもファイル名だけでも引ける"""
+
+    def __init__(self, src: BinaryIO, max_total_bytes: Optional[int] = None):
+        self._zip = zipfile.ZipFile(src)
+        self._members: Dict[str, zipfile.ZipInfo] = {}
+        total = 0
+        for info in self._zip.infolist():
+            if info.is_dir():
+                continue
+            total += info.file_size
+            self._members[info.filename] = info
+            self._members.setdefault(PurePosixPath(info.filename).name, info)
+        # 展開後の合計で見る (圧縮率の高い zip で展開サイズだけが大きいものも弾く)
+        if max_total_bytes is not None and total > max_total_bytes:
+            self._zip.close()
+            raise ArchiveTooLarge(f"Image archive expands to {total} bytes (max {max_total_bytes})")
+
+    def find(self, name: str) -> zipfile.ZipInfo:
+        info = self._members.get(name)
+        if info is None:
+            raise ImportRowError(f"Image not found in archive: {name}")
+        return info
+
+    def open(self, info: zipfile.ZipInfo):
+        return self._zip.open(info)
+
+    def close(self):
+        self._zip.close()
+
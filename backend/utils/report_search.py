@@ -0,0 +1,75 @@
+import logging
+from typing import Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger("uvicorn.error")
+
+# reports の title / description / address の全文検索インデックス
+#   sqlite:   FTS5 (trigram) の外部コンテンツテーブル + トリガーで同期
+#   postgres: pg_trgm の GIN インデックスで ILIKE を索引化
+FTS_TABLE = "reports_fts"
+SEARCH_COLUMNS = ("title", "description", "address")
+TRIGRAM_MIN_LENGTH = 3
+
+_SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON reports BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, address)
+        VALUES (new.id, new.title, new.description, new.address);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON reports BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, address)
+        VALUES ('delete', old.id, old.title, old.description, old.address);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description, address ON reports BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, address)
+        VALUES ('delete', old.id, old.title, old.description, old.address);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, address)
+        VALUES (new.id, new.title, new.description, new.address);
+    END""",
+]
+
+
+def setup_report_search(engine) -> str:
+    """検索インデックスを用意し、使えるモード ("fts5" / "trgm" / "like") を返す"""
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": FTS_TABLE},
+                ).first()
+                if not exists:
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                        f"title, description, address, content='reports', content_rowid='id', tokenize='trigram')"
+                    ))
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+                for ddl in _SQLITE_DDL:
+                    conn.execute(text(ddl))
+                return "fts5"
+            if dialect == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for column in SEARCH_COLUMNS:
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_reports_{column}_trgm "
+                        f"ON reports USING gin ({column} gin_trgm_ops)"
+                    ))
+                return "trgm"
+    except DBAPIError as e:
+        logger.warning(f"Full-text index unavailable, falling back to LIKE search: {e}")
+    return "like"
+
+
+def fts_match_expression(term: str, columns: Optional[Sequence[str]] = None) -> Optional[str]:
+    """FTS5 の MATCH 式を作る。従来の ILIKE '%term%' と同じく term 全体 (空白も含む) を 1 つの部分文字列として探す。
+    trigram で引けない短い語の場合は None"""
+    term = term.strip()
+    if len(term) < TRIGRAM_MIN_LENGTH:
+        return None
+    phrase = '"' + term.replace('"', '""') + '"'
+    if columns:
+        return "{" + " ".join(columns) + "} : " + phrase
+    return phrase
@@ -0,0 +1,72 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image as PILImage, ImageOps, features
+
+logger = logging.getLogger("uvicorn.error")
+
+# 地図ポップアップ・一覧用のサムネイルと詳細表示用のプレビュー (長辺の最大ピクセル)
+DERIVATIVE_SIZES = {"thumb": 320, "preview": 1280}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+def make_derivatives(src: str) -> Dict[str, str]:
+    """元画像の横に {stem}_thumb / {stem}_preview を書き出し、種類 → パスを返す (子プロセスで実行)"""
+    path = Path(src)
+    use_webp = features.check("webp")
+    result = {}
+    with PILImage.open(path) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+        for name, size in DERIVATIVE_SIZES.items():
+            out = path.with_name(f"{path.stem}_{name}.{'webp' if use_webp else 'jpg'}")
+            result[name] = str(out)
+            if out.exists():
+                # 同じ内容の画像 (ファイル名がダイジェスト) は作成済みの派生画像を使い回す
+                continue
+            copy = im.copy()
+            copy.thumbnail((size, size), PILImage.LANCZOS)
+            tmp = out.with_name(f"{out.name}.{os.getpid()}.part")
+            if use_webp:
+                copy.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+            else:
+                copy.convert("RGB").save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp, out)
+    return result
+
+
+def derivative_paths(src: str) -> List[Path]:
+    """src から作られうる派生画像のパス (存在確認はしない)"""
+    path = Path(src)
+    return [path.with_name(f"{path.stem}_{name}.{ext}") for name in DERIVATIVE_SIZES for ext in ("webp", "jpg")]
+
+
+class ThumbnailWorker:
+    """プロセスプールで派生画像を作り、完了したら on_done(image_id, paths) を呼ぶ"""
+
+    def __init__(self, on_done: Callable[[int, Dict[str, str]], None], max_workers: int = 2):
+        self.on_done = on_done
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def submit(self, image_id: int, src: str):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        future = self._pool.submit(make_derivatives, src)
+        future.add_done_callback(lambda f: self._finish(image_id, src, f))
+
+    def _finish(self, image_id, src, future):
+        try:
+            self.on_done(image_id, future.result())
+        except Exception as e:
+            logger.error(f"Thumbnail generation failed for image {image_id} ({src}): {e}")
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
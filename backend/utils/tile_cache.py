@@ -0,0 +1,60 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from utils.mvt import TILE_MAX_ZOOM, tile_of
+
+
+class TileCache:
+    """{root}/{scope}/{z}/{x}/{y}.pbf にタイルを保存し、レポートのあるタイルだけを消す"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        # 破棄のたびに増える。タイルを作る間に変わったら、その結果は更新を取りこぼしているので保存しない
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def _path(self, scope: str, z: int, x: int, y: int) -> Path:
+        return self.root / scope / str(z) / str(x) / f"{y}.pbf"
+
+    def get(self, scope: str, z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            return self._path(scope, z, x, y).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, scope: str, z: int, x: int, y: int, data: bytes, generation: Optional[int] = None) -> bool:
+        """タイルを保存する。generation (読み始める前の self.generation) から破棄があれば保存せずに False を返す"""
+        path = self._path(scope, z, x, y)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return True
+
+    def invalidate_point(self, lat: float, lng: float):
+        with self._lock:
+            self._generation += 1
+            if not self.root.exists():
+                return
+            scopes = [p.name for p in self.root.iterdir() if p.is_dir()]
+            for z in range(TILE_MAX_ZOOM + 1):
+                x, y = tile_of(lat, lng, z)
+                for scope in scopes:
+                    try:
+                        self._path(scope, z, x, y).unlink()
+                    except FileNotFoundError:
+                        pass
+
+    def on_report_change(self, old: Optional[dict], new: Optional[dict]):
+        for row in (old, new):
+            if row and row.get("lat") is not None and row.get("lng") is not None:
+                self.invalidate_point(row["lat"], row["lng"])
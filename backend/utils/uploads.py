@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from pathlib import Path
+from typing import BinaryIO, Dict, List, NamedTuple, Optional
+
+# アップロードファイルをワーカースレッドでチャンク単位にディスクへ書き出す
+#   - ファイル単位 / リクエスト単位のバイト上限を書き込み中に検査する
+#   - 書き込みと同時に SHA-256 を計算し、{digest[:2]}/{digest}{拡張子} に置く (同じ内容は 1 ファイル)
+CHUNK_SIZE = 256 * 1024
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds {limit} bytes")
+        self.limit = limit
+
+
+class StoredUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+    seconds: float
+    duplicate: bool  # 同じ内容のファイルが既にあり、新しく書き込まなかった
+
+
+class UploadClaims:
+    """書き出し済みで、まだ DB に参照 (upload_blobs) が書かれていないファイル (プロセス内)。
+    参照数 0 のファイルを消す側は lock を取ったうえで is_claimed を確かめ、載っているものは消さない。
+    参照を書いたトランザクションが終われば release する。終わらなかった分は ttl 秒で外れる"""
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._claims: Dict[str, List[float]] = {}
+
+    def add(self, key: str):
+        # lock を持って呼ぶ
+        self._claims.setdefault(key, []).append(time.monotonic() + self.ttl)
+
+    def release(self, key: str):
+        with self.lock:
+            expires = self._claims.get(key)
+            if expires:
+                expires.pop(0)
+                if not expires:
+                    del self._claims[key]
+
+    def is_claimed(self, key: str) -> bool:
+        # lock を持って呼ぶ
+        now = time.monotonic()
+        expires = [t for t in self._claims.get(key, ()) if t > now]
+        if expires:
+            self._claims[key] = expires
+        else:
+            self._claims.pop(key, None)
+        return bool(expires)
+
+
+class UploadBudget:
+    """1 リクエスト内の複数ファイルで共有するバイト上限"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise UploadTooLarge(self.limit)
+
+
+def store_upload(
+    src: BinaryIO,
+    directory: Path,
+    suffix: str = "",
+    max_bytes: Optional[int] = None,
+    budget: Optional[UploadBudget] = None,
+    claims: Optional[UploadClaims] = None,
+) -> StoredUpload:
+    """src を directory に書き出す (ブロッキング。スレッドプールから呼ぶ)。上限超過時は途中のファイルを消す。
+    claims を渡すと、同じ内容のファイルの有無の確認と登録を削除側と排他にして行う"""
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f"{uuid.uuid4()}.part"
+    digest = hashlib.sha256()
+    size = 0
+    started = time.perf_counter()
+    try:
+        with open(tmp, "wb") as f:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                if budget is not None:
+                    budget.consume(len(chunk))
+                digest.update(chunk)
+                f.write(chunk)
+        sha256 = digest.hexdigest()
+        path = content_path(directory, sha256, suffix)
+        with claims.lock if claims is not None else nullcontext():
+            duplicate = path.exists()
+            if duplicate:
+                tmp.unlink()
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(tmp, path)
+            if claims is not None:
+                claims.add(path.as_posix())
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return StoredUpload(path, size, sha256, time.perf_counter() - started, duplicate)
+
+
+def content_path(directory: Path, sha256: str, suffix: str = "") -> Path:
+    return directory / sha256[:2] / f"{sha256}{suffix.lower()}"
+
+
+class UploadMetrics:
+    """保存件数・バイト数・所要時間の累計。スループットとレイテンシの確認用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, stored: StoredUpload):
+        with self._lock:
+            self.count += 1
+            self.bytes += stored.size
+            self.seconds += stored.seconds
+            self.max_seconds = max(self.max_seconds, stored.seconds)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "rejected": self.rejected,
+                "bytes": self.bytes,
+                "bytesPerSec": round(self.bytes / self.seconds) if self.seconds else None,
+                "avgLatencyMs": round(self.seconds / self.count * 1000, 2) if self.count else None,
+                "maxLatencyMs": round(self.max_seconds * 1000, 2),
+            }
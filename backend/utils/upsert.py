@@ -0,0 +1,26 @@
+from typing import Optional
+
+from sqlalchemy import Table, and_
+from sqlalchemy.dialects import postgresql, sqlite
+
+# 集計行の加算を INSERT ... ON CONFLICT DO UPDATE の 1 文で行う。
+# 「UPDATE して 0 行なら INSERT」だと、同じキーを同時に初めて書いたときに一意制約違反になる
+_DIALECT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def upsert_increment(
+    connection, table: Table, key: dict, column: str, delta: int, defaults: Optional[dict] = None, **updates
+):
+    """key (主キーか一意制約の列 → 値) の行の column に delta を足し、updates の列を上書きする。
+    行が無ければ column = delta で作る (defaults は作るときだけ入れる列)"""
+    changes = {column: table.c[column] + delta, **updates}
+    values = {**(defaults or {}), **key, column: delta, **updates}
+    insert = _DIALECT_INSERTS.get(connection.dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(values)
+        connection.execute(stmt.on_conflict_do_update(index_elements=list(key), set_=changes))
+        return
+    # ON CONFLICT の無い DB では UPDATE → INSERT
+    match = and_(*(table.c[name] == value for name, value in key.items()))
+    if connection.execute(table.update().where(match).values(changes)).rowcount == 0:
+        connection.execute(table.insert().values(values))